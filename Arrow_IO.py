@@ -0,0 +1,215 @@
+'''Arrow-native Parquet/Feather I/O for the preparation steps.
+
+Reading goes through pyarrow.dataset on a memory-mapped local filesystem:
+only the projected columns are decoded, filters are pushed down so row groups
+whose statistics cannot match are skipped, and string columns are read as
+dictionary arrays, which arrive in pandas as Categoricals (codes + a small
+category table) instead of object strings. Writing converts chunks straight
+back to Arrow, so Categorical columns are written dictionary-encoded and
+numeric columns keep their dtype.
+
+Filters use the pyarrow DNF form, e.g. [('Age', '>=', 18), ('Status', '==', 'Married')].
+
+Example:
+
+    for chunk in iter_frames('feed.parquet', columns=['Age', 'Status'],
+                             filters=[('Age', '>', 0)]):
+        ...
+    with ArrowChunkWriter('prepared.parquet') as writer:
+        writer.write(chunk)
+'''
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE
+
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+FEATHER_SUFFIXES = ('.feather', '.arrow', '.ipc')
+ARROW_SUFFIXES = PARQUET_SUFFIXES + FEATHER_SUFFIXES
+
+
+def is_arrow_path(path):
+    return str(path).lower().endswith(ARROW_SUFFIXES)
+
+
+def _string_columns(schema):
+    return [field.name for field in schema
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)]
+
+
+def open_dataset(path, dictionary=True):
+    '''Memory-mapped dataset; dictionary=True reads string columns as dictionaries.'''
+    filesystem = fs.LocalFileSystem(use_mmap=True)
+    path = os.path.abspath(str(path))
+    if str(path).lower().endswith(FEATHER_SUFFIXES):
+        return ds.dataset(path, format='ipc', filesystem=filesystem)
+    file_format = ds.ParquetFileFormat()
+    if dictionary:
+        schema = pq.read_schema(path, memory_map=True)
+        file_format = ds.ParquetFileFormat(
+            read_options={'dictionary_columns': _string_columns(schema)})
+    return ds.dataset(path, format=file_format, filesystem=filesystem)
+
+
+def _expression(filters):
+    if filters is None or isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def _dictionary_encode(data):
+    # Feather files may hold plain strings; encode them per batch or table
+    strings = set(_string_columns(data.schema))
+    arrays = [column.dictionary_encode() if name in strings else column
+              for name, column in zip(data.schema.names, data.columns)]
+    return type(data).from_arrays(arrays, names=data.schema.names)
+
+
+def iter_batches(path, columns=None, filters=None, batch_size=DEFAULT_CHUNKSIZE, dictionary=True):
+    # Projected, filtered RecordBatches straight from disk
+    dataset = open_dataset(path, dictionary)
+    encode = dictionary and str(path).lower().endswith(FEATHER_SUFFIXES)
+    for batch in dataset.to_batches(columns=columns, filter=_expression(filters),
+                                    batch_size=batch_size):
+        yield _dictionary_encode(batch) if encode else batch
+
+
+def to_frame(batch):
+    # split_blocks avoids consolidating columns into one 2-D block (an extra copy)
+    return batch.to_pandas(split_blocks=True)
+
+
+def iter_frames(path, columns=None, filters=None, batch_size=DEFAULT_CHUNKSIZE, dictionary=True):
+    # Row labels run on across batches, as they do for CSV chunks
+    start = 0
+    for batch in iter_batches(path, columns, filters, batch_size, dictionary):
+        if batch.num_rows:
+            frame = to_frame(batch)
+            frame.index = pd.RangeIndex(start, start + len(frame))
+            start += len(frame)
+            yield frame
+
+
+def read_table(path, columns=None, filters=None, dictionary=True):
+    # Whole (projected, filtered) table, for inputs that do fit in memory
+    table = open_dataset(path, dictionary).to_table(columns=columns, filter=_expression(filters))
+    if dictionary and str(path).lower().endswith(FEATHER_SUFFIXES):
+        table = _dictionary_encode(table)
+    return table
+
+
+def _output_schema(schema, keep_dictionaries):
+    # int32 dictionary indices fit any chunk, whatever width pandas chose for its codes
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            if keep_dictionaries:
+                wide = pa.dictionary(pa.int32(), field.type.value_type, field.type.ordered)
+            else:
+                wide = field.type.value_type
+            schema = schema.set(i, field.with_type(wide))
+    return schema
+
+
+class ArrowChunkWriter:
+    '''Write DataFrame chunks to Parquet or Feather without going through object dtype.
+
+    The schema of the first chunk is kept (with dictionary indices widened to
+    int32) and later chunks are cast to it. When a later chunk needs a wider
+    type (an int column that gained a NaN and arrives as float, an all-null
+    column that now has values) the schemas are unified with Arrow's
+    permissive promotion and the rows written so far are rewritten once with
+    the wider schema; genuinely incompatible types raise TypeError. Feather
+    files allow only one dictionary per column for the whole file, so chunk
+    dictionaries are decoded there; Parquet keeps them.
+    '''
+
+    def __init__(self, path, compression='zstd'):
+        self.path = str(path)
+        self.compression = compression
+        self.schema = None
+        self._writer = None
+        self._sink = None
+
+    def _open(self, schema):
+        self.schema = schema
+        if self.path.lower().endswith(FEATHER_SUFFIXES):
+            self._sink = pa.OSFile(self.path, 'wb')
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self._writer = pa.ipc.new_file(self._sink, schema, options=options)
+        else:
+            self._writer = pq.ParquetWriter(self.path, schema, compression=self.compression,
+                                            use_dictionary=True)
+
+    @property
+    def _feather(self):
+        return self.path.lower().endswith(FEATHER_SUFFIXES)
+
+    def write(self, chunk):
+        table = chunk if isinstance(chunk, pa.Table) else pa.Table.from_pandas(
+            chunk, preserve_index=False)
+        if self._writer is None:
+            self._open(_output_schema(table.schema, keep_dictionaries=not self._feather))
+        if table.schema != self.schema:
+            try:
+                table = table.cast(self.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, ValueError):
+                schema = self._unified(table.schema)
+                self._rewrite(schema)
+                table = table.cast(schema)
+        self._writer.write_table(table)
+
+    def _unified(self, schema):
+        # Wider schema that holds both the file so far and this chunk
+        if schema.names != self.schema.names:
+            raise TypeError(f'Chunk columns {schema.names} do not match the columns '
+                            f'{self.schema.names} already written to {self.path}')
+        schema = _output_schema(schema, keep_dictionaries=not self._feather)
+        try:
+            return pa.unify_schemas([self.schema, schema], promote_options='permissive')
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as error:
+            raise TypeError(f'Cannot write this chunk to {self.path}: {error}') from error
+
+    def _rewrite(self, schema):
+        # A file's schema is fixed once opened, so copy what was written into a wider one
+        self.close()
+        base, suffix = os.path.splitext(self.path)
+        written = f'{base}.narrow{suffix}'
+        os.replace(self.path, written)
+        try:
+            self._open(schema)
+            for batch in iter_batches(written, dictionary=not self._feather):
+                self._writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+        finally:
+            os.remove(written)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_frame(frame, path, compression='zstd'):
+    with ArrowChunkWriter(path, compression) as writer:
+        writer.write(frame)
+
+
+def categorical_frame(frame, columns=None):
+    # Convert object string columns to Categoricals so they are written as dictionaries
+    columns = columns or [name for name, dtype in frame.dtypes.items()
+                          if dtype == object or pd.api.types.is_string_dtype(dtype)]
+    return frame.astype({column: 'category' for column in columns})
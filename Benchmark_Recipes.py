@@ -0,0 +1,446 @@
+'''Benchmark harness for the data-preparation recipes.
+
+Times every recipe from the tutorial scripts next to the scalable versions in
+this repo, on synthetic data of configurable shape:
+
+    standardise  StandardScaler vs manual pandas formula vs RunningMoments
+    recode       replace vs map vs apply vs pd.Categorical vs Category_Recode.recode
+    onehot       pd.get_dummies vs SparseOneHotEncoder
+    outliers     scipy zscore / IQR / percentiles / IsolationForest vs Zscore_Outliers
+    index        df.index + 1 vs reset_index() vs Index_Partitions.assign_ids
+
+Recipes are grouped into tasks (e.g. outliers/zscore) that must produce the
+same result; before anything is timed, every selected recipe runs on a small
+sample and its output is checked against the others of its task, so
+best_by_shape only ranks equivalent work.
+
+Each (recipe, rows) case runs in a fresh process, so its peak RSS is not
+polluted by earlier cases; a case that exceeds --timeout is killed. Wall
+time, peak RSS, tracemalloc peak and rows/s are written to JSON together
+with the data shape and library versions.
+
+Usage:
+
+    python Benchmark_Recipes.py --rows 1e4 1e5 1e6 --families recode outliers \\
+        --cardinality 50 --null-rate 0.01 --output bench.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+LABELS = ['Low', 'Medium', 'High']
+CHECK_ROWS = 5_000
+
+
+def make_numeric(rows, columns=2, skew=0.0, null_rate=0.0, seed=0):
+    '''Float columns; skew > 0 gives lognormal tails (and more outliers).'''
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(rows, columns))
+    if skew > 0:
+        values = np.exp(skew * values)
+    values = values * 10_000 + 50_000
+    if null_rate:
+        values[rng.random((rows, columns)) < null_rate] = np.nan
+    return pd.DataFrame(values, columns=[f'x{i}' for i in range(columns)])
+
+
+def make_categorical(rows, cardinality=3, skew=0.0, null_rate=0.0, messy=False, seed=0):
+    '''One label column; skew > 0 draws labels from a Zipf-like distribution.
+
+    messy=True adds the case/space variants seen in Categorical_Field.py.
+    '''
+    rng = np.random.default_rng(seed)
+    labels = LABELS if cardinality <= len(LABELS) else [f'Label{i}' for i in range(cardinality)]
+    labels = labels[:cardinality]
+    weights = 1.0 / np.arange(1, len(labels) + 1) ** skew
+    codes = rng.choice(len(labels), size=rows, p=weights / weights.sum())
+    table = np.array(labels, dtype=object)
+    if messy:
+        table = np.concatenate([table, np.char.upper(table.astype(str)).astype(object),
+                                np.array([f'  {label} ' for label in labels], dtype=object)])
+        codes = codes + len(labels) * rng.integers(0, 3, size=rows)
+    values = table[codes]
+    if null_rate:
+        values[rng.random(rows) < null_rate] = None
+    return pd.Series(values, name='Category')
+
+
+def _standardise_sklearn(data):
+    from sklearn.preprocessing import StandardScaler
+
+    return StandardScaler().fit_transform(data)
+
+
+def _standardise_manual(data):
+    result = data.copy()
+    for column in data.columns:
+        # ddof=0, as StandardScaler, so all standardise recipes agree
+        result[column] = (data[column] - data[column].mean()) / data[column].std(ddof=0)
+    return result
+
+
+def _standardise_moments(data):
+    from Streaming_Standardise import RunningMoments
+
+    moments = RunningMoments(data.columns).update(data.to_numpy())
+    return (data.to_numpy() - moments.mean) / moments.scale()
+
+
+def _mapping(series):
+    return {label: label[:1] for label in pd.unique(series.dropna())}
+
+
+def _recode_replace(series):
+    return series.replace(_mapping(series))
+
+
+def _recode_map(series):
+    return series.map(_mapping(series))
+
+
+def _recode_apply(series):
+    mapping = _mapping(series)
+    return series.apply(lambda value: mapping.get(value, value))
+
+
+def _recode_categorical(series):
+    # Mapping a categorical Series maps its categories, not every row
+    return pd.Series(pd.Categorical(series)).map(_mapping(series))
+
+
+def _recode_engine(series):
+    from Category_Recode import recode
+
+    return recode(series, _mapping(series))
+
+
+def _onehot_dummies(series):
+    return pd.get_dummies(series)
+
+
+def _onehot_sparse(series):
+    from Sparse_OneHot import SparseOneHotEncoder
+
+    encoder = SparseOneHotEncoder().fit(series)
+    return encoder.transform(series), encoder.feature_names()
+
+
+def _outliers_scipy_zscore(data):
+    from scipy.stats import zscore
+
+    frame = data.copy()
+    frame['Z-Score'] = zscore(frame['x0'], nan_policy='omit')
+    return frame[frame['Z-Score'].abs() > 3]
+
+
+def _outliers_iqr(data):
+    q1, q3 = data['x0'].quantile(0.25), data['x0'].quantile(0.75)
+    iqr = q3 - q1
+    return data[(data['x0'] < q1 - 1.5 * iqr) | (data['x0'] > q3 + 1.5 * iqr)]
+
+
+def _outliers_percentile(data):
+    low, high = data['x0'].quantile(0.01), data['x0'].quantile(0.99)
+    return data[(data['x0'] < low) | (data['x0'] > high)]
+
+
+def _outliers_iforest(data):
+    from sklearn.ensemble import IsolationForest
+
+    frame = data.fillna(0).copy()
+    frame['Outlier'] = IsolationForest(contamination=0.2, random_state=0).fit_predict(frame)
+    return frame[frame['Outlier'] == -1]
+
+
+def _outliers_vectorised(data):
+    from Zscore_Outliers import zscore_outlier_rows
+
+    return data.iloc[zscore_outlier_rows(data, ['x0'])]
+
+
+def _index_plus_one(data):
+    frame = data.copy()
+    frame['Index'] = frame.index + 1
+    return frame
+
+
+def _index_reset(data):
+    return data.reset_index(drop=False)
+
+
+def _index_lazy(data):
+    from Index_Partitions import RowIdRange, assign_ids
+
+    return assign_ids(data, RowIdRange(1, len(data) + 1))
+
+
+# name -> (family, task, data kind, function, max rows or None); recipes of one
+# task must return equivalent output (see _canonical)
+RECIPES = {
+    'standardise/sklearn': ('standardise', 'standardise', 'numeric', _standardise_sklearn, None),
+    'standardise/manual_pandas': ('standardise', 'standardise', 'numeric', _standardise_manual,
+                                  None),
+    'standardise/running_moments': ('standardise', 'standardise', 'numeric', _standardise_moments,
+                                    None),
+    'recode/replace': ('recode', 'recode', 'categorical', _recode_replace, None),
+    'recode/map': ('recode', 'recode', 'categorical', _recode_map, None),
+    'recode/apply': ('recode', 'recode', 'categorical', _recode_apply, 10_000_000),
+    'recode/categorical': ('recode', 'recode', 'categorical', _recode_categorical, None),
+    'recode/dictionary_engine': ('recode', 'recode', 'categorical', _recode_engine, None),
+    'onehot/get_dummies': ('onehot', 'onehot', 'categorical', _onehot_dummies, None),
+    'onehot/sparse_csr': ('onehot', 'onehot', 'categorical', _onehot_sparse, None),
+    'outliers/scipy_zscore': ('outliers', 'outliers/zscore', 'numeric', _outliers_scipy_zscore,
+                              None),
+    'outliers/iqr': ('outliers', 'outliers/iqr', 'numeric', _outliers_iqr, None),
+    'outliers/percentile': ('outliers', 'outliers/percentile', 'numeric', _outliers_percentile,
+                            None),
+    'outliers/isolation_forest': ('outliers', 'outliers/isolation_forest', 'numeric',
+                                  _outliers_iforest, 1_000_000),
+    'outliers/vectorised_zscore': ('outliers', 'outliers/zscore', 'numeric', _outliers_vectorised,
+                                   None),
+    'index/plus_one': ('index', 'index', 'numeric', _index_plus_one, None),
+    'index/reset_index': ('index', 'index', 'numeric', _index_reset, None),
+    'index/lazy_range': ('index', 'index', 'numeric', _index_lazy, None),
+}
+
+
+def _canonical(task, output):
+    '''Reduce a recipe's output to a comparable array for its task.'''
+    family = task.split('/')[0]
+    if family == 'standardise':
+        return np.asarray(output, dtype=np.float64)
+    if family == 'recode':
+        values = np.asarray(output, dtype=object)
+        values[pd.isna(values)] = None
+        return values
+    if family == 'onehot':
+        # Label of the one hot column per row (None for all-zero rows)
+        if isinstance(output, tuple):
+            matrix, names = output
+            matrix = matrix.tocsr()
+            counts = np.diff(matrix.indptr)
+            labels = np.full(matrix.shape[0], None, dtype=object)
+            labels[counts > 0] = np.asarray(names, dtype=object)[matrix.indices]
+            return labels
+        values = output.to_numpy(dtype=bool)
+        labels = np.asarray(output.columns, dtype=object).astype(str)[values.argmax(axis=1)]
+        return np.where(values.any(axis=1), labels, None)
+    if family == 'outliers':
+        return np.asarray(output.index)
+    if family == 'index':
+        # 1-based row numbers, however the recipe exposes them
+        if 'Index' in output:
+            return output['Index'].to_numpy()
+        if 'index' in output:
+            return output['index'].to_numpy() + 1
+        return np.asarray(output.index)
+    raise ValueError(f'No canonical form for task {task!r}')
+
+
+def _data(kind, rows, shape):
+    if kind == 'numeric':
+        return make_numeric(rows, shape['columns'], shape['skew'], shape['null_rate'],
+                            shape['seed'])
+    return make_categorical(rows, shape['cardinality'], shape['skew'], shape['null_rate'],
+                            shape['messy'], shape['seed'])
+
+
+def check_equivalence(names, shape, rows=CHECK_ROWS):
+    '''Raise ValueError if recipes of the same task disagree on a small sample.'''
+    reference = {}
+    for name in names:
+        _, task, kind, func, _ = RECIPES[name]
+        result = _canonical(task, func(_data(kind, rows, shape)))
+        if task not in reference:
+            reference[task] = (name, result)
+            continue
+        first, expected = reference[task]
+        if result.dtype.kind == 'f' and expected.dtype.kind == 'f':
+            same = result.shape == expected.shape and np.allclose(result, expected, equal_nan=True)
+        else:
+            same = result.shape == expected.shape and bool((result == expected).all())
+        if not same:
+            raise ValueError(f'{name} does not produce the same {task} result as {first}')
+
+
+def _peak_rss_bytes():
+    '''Peak resident set size of this process.
+
+    On Linux ru_maxrss is inherited from the parent across fork and exec, so
+    it would report the harness's high-water mark; VmHWM starts afresh with
+    the exec of each case process.
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _run_case(name, rows, shape, repeat):
+    # Runs in a fresh process: generate data, then time the recipe
+    sys.path.insert(0, shape.pop('path'))
+    family, _, kind, func, _ = RECIPES[name]
+    data = _data(kind, rows, shape)
+    # Warm up on a small slice so library imports are not timed
+    func(data.iloc[:1000])
+    rss_before = _peak_rss_bytes()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - start)
+    peak_rss = _peak_rss_bytes()
+    # tracemalloc slows allocation down, so it gets its own untimed run
+    tracemalloc.start()
+    func(data)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(times)
+    return {
+        'recipe': name,
+        'family': family,
+        'task': RECIPES[name][1],
+        'rows': rows,
+        'wall_seconds': best,
+        'wall_seconds_all': times,
+        'rows_per_second': rows / best if best else None,
+        'peak_rss_bytes': peak_rss,
+        'peak_rss_growth_bytes': peak_rss - rss_before,
+        'traced_peak_bytes': traced_peak,
+    }
+
+
+def _case_process(connection, name, rows, shape, repeat):
+    try:
+        connection.send(('ok', _run_case(name, rows, shape, repeat)))
+    except Exception as error:
+        connection.send(('error', repr(error)))
+    finally:
+        connection.close()
+
+
+def _run_isolated(context, name, rows, shape, repeat, timeout):
+    '''Run one case in its own process; kill it if it takes longer than timeout.'''
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_process, args=(sender, name, rows, shape, repeat))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            process.join()
+            raise TimeoutError(f'case exceeded {timeout} s and was killed')
+        try:
+            status, payload = receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f'case process died with exit code {process.exitcode}') from None
+        process.join()
+    finally:
+        receiver.close()
+    if status == 'error':
+        raise RuntimeError(payload)
+    return payload
+
+
+def run_benchmarks(rows, families=None, recipes=None, repeat=3, timeout=None, **shape):
+    '''Run every selected (recipe, rows) case in its own process; return result records.'''
+    shape = {'columns': 2, 'cardinality': 3, 'skew': 0.0, 'null_rate': 0.0, 'messy': False,
+             'seed': 0, **shape}
+    selected = [name for name, (family, *_rest) in RECIPES.items()
+                if (not families or family in families) and (not recipes or name in recipes)]
+    check_equivalence(selected, shape)
+    results = []
+    context = get_context('spawn')
+    for n in rows:
+        for name in selected:
+            record = {'recipe': name, 'family': RECIPES[name][0], 'task': RECIPES[name][1],
+                      'rows': n}
+            limit = RECIPES[name][4]
+            if limit is not None and n > limit:
+                results.append({**record, 'skipped': f'rows above limit {limit}'})
+                continue
+            case_shape = {**shape, 'path': os.path.dirname(os.path.abspath(__file__))}
+            try:
+                results.append(_run_isolated(context, name, n, case_shape, repeat, timeout))
+            except Exception as error:
+                results.append({**record, 'error': repr(error)})
+            print(_format(results[-1]), flush=True)
+    return results
+
+
+def _format(record):
+    if 'wall_seconds' not in record:
+        status = record.get('skipped') or record.get('error')
+        return f"{record['recipe']:<32} {record['rows']:>12,}  {status}"
+    return (f"{record['recipe']:<32} {record['rows']:>12,}  {record['wall_seconds']:>9.4f}s  "
+            f"{record['rows_per_second']:>14,.0f} rows/s  "
+            f"{record['peak_rss_bytes'] / 2**20:>8.1f} MiB")
+
+
+def best_by_shape(results):
+    # Fastest recipe per (task, rows); only recipes of one task do the same work
+    timed = pd.DataFrame([record for record in results if 'wall_seconds' in record])
+    if timed.empty:
+        return timed
+    best = timed.loc[timed.groupby(['task', 'rows'])['wall_seconds'].idxmin()]
+    return best[['task', 'rows', 'recipe', 'wall_seconds', 'peak_rss_bytes']]
+
+
+def environment():
+    versions = {'python': platform.python_version(), 'numpy': np.__version__,
+                'pandas': pd.__version__}
+    for module in ('sklearn', 'scipy', 'pyarrow'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {'platform': platform.platform(), 'processor': platform.processor(), **versions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', nargs='+', type=float, default=[1e4, 1e5, 1e6])
+    parser.add_argument('--families', nargs='*', choices=sorted({r[0] for r in RECIPES.values()}))
+    parser.add_argument('--recipes', nargs='*', choices=sorted(RECIPES))
+    parser.add_argument('--columns', type=int, default=2)
+    parser.add_argument('--cardinality', type=int, default=3)
+    parser.add_argument('--skew', type=float, default=0.0)
+    parser.add_argument('--null-rate', type=float, default=0.0)
+    parser.add_argument('--messy', action='store_true', help='add case/space label variants')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per case')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args(argv)
+
+    shape = {'columns': args.columns, 'cardinality': args.cardinality, 'skew': args.skew,
+             'null_rate': args.null_rate, 'messy': args.messy, 'seed': args.seed}
+    rows = [int(n) for n in args.rows]
+    results = run_benchmarks(rows, args.families, args.recipes, args.repeat, args.timeout, **shape)
+    with open(args.output, 'w') as handle:
+        json.dump({'environment': environment(), 'shape': shape, 'repeat': args.repeat,
+                   'results': results}, handle, indent=2)
+    print()
+    print(best_by_shape(results).to_string(index=False))
+    print(f'\nResults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''Dictionary-encoded re-expression of categorical labels.
+
+Series.replace({...}), .map({...}), .apply(correct_status) and the
+.str.lower().str.strip() chains in Categorical_Field.py and
+Change_Misleading.py all run once per row on object strings. Here the column
+is factorised into integer codes once, normalisation and the mapping run only
+over the small table of distinct values, and the new column is rebuilt with a
+single integer gather (lookup[codes]). With ~50 distinct values the Python
+work no longer depends on the number of rows.
+
+Example:
+
+    df['Category'] = recode(df['Category'], {'low': 'L', 'medium': 'M', 'high': 'H'},
+                            normalise=True)
+    df['Status'] = recode(df['Status'], correct_status)
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def encode(series):
+    '''Integer codes (-1 for missing) and the Index of distinct values.'''
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return codes, pd.Index(uniques)
+
+
+def normalise_values(values, lower=True, strip=True):
+    # Apply the lower/strip chain to a small array of distinct values
+    values = pd.Series(values, dtype=object)
+    is_text = values.map(lambda value: isinstance(value, str))
+    text = values[is_text].astype(str)
+    if lower:
+        text = text.str.lower()
+    if strip:
+        text = text.str.strip()
+    values[is_text] = text
+    return values.to_numpy(dtype=object)
+
+
+def _map_values(values, mapping, unmapped):
+    if mapping is None:
+        return values
+    if callable(mapping):
+        return np.array([mapping(value) for value in values], dtype=object)
+    if unmapped == 'keep':
+        return np.array([mapping.get(value, value) for value in values], dtype=object)
+    return np.array([mapping.get(value, np.nan) for value in values], dtype=object)
+
+
+def recode(series, mapping=None, normalise=False, unmapped='keep', as_category=True):
+    '''Re-express the labels of a column through its category table.
+
+    mapping is a dict or a function of one label (like correct_status).
+    unmapped='keep' leaves labels missing from a dict as they are (replace);
+    unmapped='nan' turns them into NaN (map). normalise=True lower-cases and
+    strips text labels before the mapping is applied; a function of the
+    array of distinct values (e.g. a Normalise_Cache.NormaliseCache) can be
+    passed instead. The result is a categorical Series unless
+    as_category=False.
+    '''
+    if unmapped not in ('keep', 'nan'):
+        raise ValueError(f"unmapped must be 'keep' or 'nan', not {unmapped!r}")
+    codes, categories = encode(series)
+    values = categories.to_numpy(dtype=object)
+    if callable(normalise):
+        values = normalise(values)
+    elif normalise:
+        values = normalise_values(values)
+    values = _map_values(values, mapping, unmapped)
+    return _rebuild(series, codes, values, as_category)
+
+
+def normalise_labels(series, lower=True, strip=True, as_category=True):
+    # .str.lower().str.strip() evaluated once per distinct value
+    codes, categories = encode(series)
+    values = normalise_values(categories.to_numpy(dtype=object), lower, strip)
+    return _rebuild(series, codes, values, as_category)
+
+
+def _rebuild(series, codes, values, as_category):
+    # Several old labels may collapse to one new label, so factorise again
+    new_codes, new_categories = pd.factorize(pd.Series(values, dtype=object),
+                                             use_na_sentinel=True)
+    # codes == -1 (missing) indexes the trailing -1 entry of lookup
+    lookup = np.append(new_codes, -1).astype(np.int32)
+    result = pd.Categorical.from_codes(lookup[codes], categories=pd.Index(new_categories))
+    if not as_category:
+        result = np.asarray(result, dtype=object)
+    return pd.Series(result, index=series.index, name=series.name)
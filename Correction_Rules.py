@@ -0,0 +1,329 @@
+'''Declarative correction rules compiled into vectorised masks.
+
+Change_Misleading.py fixes values with row-wise Python loops, e.g.
+
+    df.apply(lambda row: 'Minor' if row['Age'] < 18 and row['Status'] == 'Married'
+             else row['Status'], axis=1)
+    df['Age'].apply(lambda x: 99 if x > 100 else x)
+
+Here each fix is a Rule (condition over columns -> assignment to one column).
+A RuleSet pulls every referenced column out as a NumPy array once, evaluates
+all conditions as boolean masks, and rewrites each target column once, with
+one masked write per rule on rows no earlier rule claimed, so the whole rule
+set is one fused pass and the column keeps its dtype (Categorical, Int64).
+
+Precedence: every condition sees the input values (rules do not feed each
+other), and when several rules match the same row and target column the rule
+listed first wins, like CASE WHEN. The report counts the rows each rule
+actually changed after precedence; rows that already held the value (NaN
+included) are not counted.
+
+Example:
+
+    rules = RuleSet([
+        Rule('minor_married', 'Status', 'Minor',
+             when=(Col('Age') < 18) & (Col('Status') == 'Married')),
+        Rule('cap_age', 'Age', 99, when=Col('Age') > 100),
+    ])
+    df, report = rules.apply(df)
+
+Rules can also be written as data for the command line, with conditions as
+Python-like expression strings (parsed, never evaluated):
+
+    rules = rules_from_spec([{'name': 'cap_age', 'column': 'Age', 'value': 99,
+                              'when': 'Age > 100'}])
+'''
+
+import ast
+import operator
+
+import numpy as np
+import pandas as pd
+
+
+class Expr:
+    '''A vectorised expression over named columns.'''
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def columns(self):
+        names = set()
+        for arg in self.args:
+            if isinstance(arg, Expr):
+                names |= arg.columns()
+        return names
+
+    def evaluate(self, arrays):
+        values = [arg.evaluate(arrays) if isinstance(arg, Expr) else arg for arg in self.args]
+        return self.func(*values)
+
+    def _binary(self, func, other, reverse=False):
+        return Expr(func, other, self) if reverse else Expr(func, self, other)
+
+    def __lt__(self, other):
+        return self._binary(operator.lt, other)
+
+    def __le__(self, other):
+        return self._binary(operator.le, other)
+
+    def __gt__(self, other):
+        return self._binary(operator.gt, other)
+
+    def __ge__(self, other):
+        return self._binary(operator.ge, other)
+
+    def __eq__(self, other):
+        return self._binary(operator.eq, other)
+
+    def __ne__(self, other):
+        return self._binary(operator.ne, other)
+
+    def __and__(self, other):
+        return self._binary(operator.and_, other)
+
+    def __or__(self, other):
+        return self._binary(operator.or_, other)
+
+    def __invert__(self):
+        return Expr(operator.invert, self)
+
+    def __add__(self, other):
+        return self._binary(operator.add, other)
+
+    def __sub__(self, other):
+        return self._binary(operator.sub, other)
+
+    def __mul__(self, other):
+        return self._binary(operator.mul, other)
+
+    def __truediv__(self, other):
+        return self._binary(operator.truediv, other)
+
+    def __radd__(self, other):
+        return self._binary(operator.add, other, reverse=True)
+
+    def __rsub__(self, other):
+        return self._binary(operator.sub, other, reverse=True)
+
+    def __rmul__(self, other):
+        return self._binary(operator.mul, other, reverse=True)
+
+    def isin(self, values):
+        return Expr(lambda array: np.isin(array, list(values)), self)
+
+    def isna(self):
+        return Expr(lambda array: pd.isna(array), self)
+
+    def notna(self):
+        return Expr(lambda array: ~pd.isna(array), self)
+
+    __hash__ = None
+
+
+class Col(Expr):
+    '''Reference to a column of the frame being corrected.'''
+
+    def __init__(self, name):
+        super().__init__(None)
+        self.name = name
+
+    def columns(self):
+        return {self.name}
+
+    def evaluate(self, arrays):
+        return arrays[self.name]
+
+    def __repr__(self):
+        return f'Col({self.name!r})'
+
+
+class Rule:
+    '''Set column to value on rows where the condition holds.
+
+    when is an Expr or a function of the DataFrame returning a boolean mask;
+    value is a constant, an Expr or a function of the DataFrame.
+    '''
+
+    def __init__(self, name, column, value, when):
+        self.name = name
+        self.column = column
+        self.value = value
+        self.when = when
+
+    def columns(self):
+        names = {self.column}
+        for part in (self.when, self.value):
+            if isinstance(part, Expr):
+                names |= part.columns()
+        return names
+
+    def _evaluate(self, part, frame, arrays):
+        if isinstance(part, Expr):
+            return part.evaluate(arrays)
+        if callable(part):
+            result = part(frame)
+            return result.to_numpy() if isinstance(result, pd.Series) else result
+        return part
+
+
+class RuleSet:
+    '''An ordered list of Rules applied in one fused pass.'''
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError('Rule names must be unique')
+
+    def masks(self, frame):
+        # Evaluate every condition once against the input values
+        referenced = set().union(*(rule.columns() for rule in self.rules)) if self.rules else set()
+        arrays = {name: frame[name].to_numpy() for name in referenced if name in frame}
+        masks = []
+        for rule in self.rules:
+            mask = rule._evaluate(rule.when, frame, arrays)
+            mask = np.broadcast_to(np.asarray(mask, dtype=bool), (len(frame),))
+            masks.append(mask)
+        return arrays, masks
+
+    def apply(self, frame, inplace=False):
+        '''Apply all rules; return (frame, report of rows changed per rule).
+
+        A row counts as changed only if its value differs afterwards (NaN
+        equals NaN). Target columns keep their dtype where the new values
+        allow it (Categorical gains any new labels, Int64 stays Int64).
+        '''
+        arrays, masks = self.masks(frame)
+        if not inplace:
+            frame = frame.copy()
+        report = {}
+        for target in dict.fromkeys(rule.column for rule in self.rules):
+            indexed = [(i, rule) for i, rule in enumerate(self.rules) if rule.column == target]
+            claimed = np.zeros(len(frame), dtype=bool)
+            effective, choices = [], []
+            for i, rule in indexed:
+                effective.append(masks[i] & ~claimed)
+                claimed |= masks[i]
+                choices.append(rule._evaluate(rule.value, frame, arrays))
+            if not claimed.any():
+                report.update((rule.name, 0) for _, rule in indexed)
+                continue
+            current = frame[target] if target in frame else pd.Series(np.nan, index=frame.index)
+            updated = _assign(current, effective, choices)
+            changed = _changed(current, updated, np.flatnonzero(claimed))
+            for (_, rule), mask in zip(indexed, effective):
+                report[rule.name] = int((mask & changed).sum())
+            frame[target] = updated
+        return frame, pd.Series(report, name='rows_changed', dtype=np.int64).reindex(
+            [rule.name for rule in self.rules])
+
+
+def _assign(current, masks, choices):
+    # Write each rule's value on its (disjoint) rows through the Series, keeping the dtype
+    if isinstance(current.dtype, pd.CategoricalDtype):
+        written = []
+        for mask, choice in zip(masks, choices):
+            if np.ndim(choice) == 0:
+                written.extend([choice] if mask.any() else [])
+            else:
+                written.extend(np.asarray(choice, dtype=object)[mask].tolist())
+        new = pd.Index(pd.unique(pd.Series(written, dtype=object).dropna()))
+        new = new[~new.isin(current.cat.categories)]
+        if len(new):
+            current = current.cat.add_categories(new)
+    updated = current
+    for mask, choice in zip(masks, choices):
+        if mask.any():
+            updated = updated.mask(mask, choice)
+    return updated
+
+
+def _changed(before, after, rows):
+    # Whether each of the given rows differs, with missing == missing
+    old = pd.Series(before.to_numpy(dtype=object)[rows], dtype=object)
+    new = pd.Series(after.to_numpy(dtype=object)[rows], dtype=object)
+    old_missing, new_missing = old.isna().to_numpy(), new.isna().to_numpy()
+    equal = (old == new).to_numpy(dtype=bool)
+    changed = np.zeros(len(before), dtype=bool)
+    changed[rows] = ~((old_missing & new_missing) | (~old_missing & ~new_missing & equal))
+    return changed
+
+
+_COMPARE = {ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+            ast.Eq: operator.eq, ast.NotEq: operator.ne}
+_BINARY = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+           ast.Div: operator.truediv, ast.BitAnd: operator.and_, ast.BitOr: operator.or_}
+
+
+def _compare(op, left, right):
+    if isinstance(op, (ast.In, ast.NotIn)):
+        test = left.isin(right)
+        return ~test if isinstance(op, ast.NotIn) else test
+    return _COMPARE[type(op)](left, right)
+
+
+def _build(node):
+    if isinstance(node, ast.Expression):
+        return _build(node.body)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return Col(node.id)
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [_build(item) for item in node.elts]
+    if isinstance(node, ast.Compare):
+        left, result = _build(node.left), None
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _build(comparator)
+            test = _compare(op, left, right)
+            result = test if result is None else result & test
+            left = right
+        return result
+    if isinstance(node, ast.BoolOp):
+        parts = [_build(value) for value in node.values]
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        result = parts[0]
+        for part in parts[1:]:
+            result = combine(result, part)
+        return result
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.Invert)):
+        return ~_build(node.operand)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = _build(node.operand)
+        return -operand if not isinstance(operand, Expr) else 0 - operand
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        return _BINARY[type(node.op)](_build(node.left), _build(node.right))
+    if isinstance(node, ast.Call) and not node.keywords:
+        args = [_build(arg) for arg in node.args]
+        if isinstance(node.func, ast.Name) and node.func.id == 'col' and len(args) == 1:
+            return Col(args[0])
+        if isinstance(node.func, ast.Attribute) and node.func.attr in ('isin', 'isna', 'notna'):
+            return getattr(_build(node.func.value), node.func.attr)(*args)
+    raise ValueError(f'Unsupported syntax in rule expression: {ast.unparse(node)!r}')
+
+
+def parse_expr(text):
+    '''Expr from a string such as "Age < 18 and Status == 'Married'".
+
+    Bare names are columns (col('Name with spaces') for others); supported are
+    comparisons, in / not in, and / or / not, + - * /, .isin(), .isna() and
+    .notna().
+    '''
+    return _build(ast.parse(text, mode='eval'))
+
+
+def rules_from_spec(spec):
+    '''RuleSet from a list of {name, column, value, when} dicts.
+
+    when is an expression string; value is a constant, or an expression
+    string when given as {"expr": "..."}.
+    '''
+    rules = []
+    for item in spec:
+        value = item['value']
+        if isinstance(value, dict) and 'expr' in value:
+            value = parse_expr(value['expr'])
+        rules.append(Rule(item['name'], item['column'], value, parse_expr(item['when'])))
+    return RuleSet(rules)
@@ -0,0 +1,110 @@
+'''Shrink a DataFrame's working set before preparation.
+
+The frames in Standardise_Numeric.py and Outliers.py default to int64/float64
+and object strings; a five-value 'Status' or 'Category' column stored as
+object strings costs a Python object per row. optimise_frame downcasts
+integers to the narrowest signed type that holds their range (nullable Int64
+columns with missing values to Int8/Int16/Int32; unsigned types only with
+unsigned=True, as arithmetic on them wraps, e.g. uint8 Age - 50), floats to float32
+only where that is lossless (or always, with float32=True), and turns
+low-cardinality string columns into Categoricals with int8/int16 codes. It
+returns a per-column report of bytes before and after.
+
+Example:
+
+    df, report = optimise_frame(df)
+    print(report)
+    print(f"{report['bytes_before'].sum() / report['bytes_after'].sum():.1f}x smaller")
+'''
+
+import numpy as np
+import pandas as pd
+
+_SIGNED = (np.int8, np.int16, np.int32, np.int64)
+_UNSIGNED = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+def _downcast_integer(series, unsigned=False):
+    numpy_dtype = series.dtype if isinstance(series.dtype, np.dtype) else series.dtype.numpy_dtype
+    if series.isna().all():
+        return series
+    low, high = series.min(), series.max()
+    candidates = _UNSIGNED if unsigned and low >= 0 else _SIGNED
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            break
+    else:
+        return series
+    dtype = np.dtype(dtype)
+    if dtype.itemsize >= numpy_dtype.itemsize:
+        return series
+    if isinstance(series.dtype, np.dtype):
+        return series.astype(dtype)
+    # Nullable integers keep their missing values: Int64 -> Int8 and so on
+    return series.astype(dtype.name.replace('uint', 'UInt').replace('int', 'Int'))
+
+
+def _downcast_float(series, float32):
+    narrow = series.astype(np.float32)
+    if float32:
+        return narrow
+    # Keep float64 unless every value survives the round trip exactly
+    values = series.to_numpy()
+    if np.array_equal(narrow.to_numpy().astype(np.float64), values, equal_nan=True):
+        return narrow
+    return series
+
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def optimise_frame(frame, columns=None, max_category_ratio=0.5, max_categories=32_767,
+                   float32=False, unsigned=False):
+    '''Return (optimised frame, per-column memory report).
+
+    A text column becomes a Categorical when its distinct values number at
+    most max_categories and at most max_category_ratio of its rows.
+    float32=True also narrows floats where precision would be lost, e.g. for
+    scaling in float32. unsigned=True lets non-negative integer columns
+    become unsigned (e.g. 0..255 in uint8 rather than int16).
+    '''
+    columns = list(frame.columns if columns is None else columns)
+    result = frame.copy()
+    rows = []
+    for column in columns:
+        series = frame[column]
+        before = int(series.memory_usage(index=False, deep=True))
+        if pd.api.types.is_bool_dtype(series.dtype):
+            converted = series
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            converted = _downcast_integer(series, unsigned)
+        elif pd.api.types.is_float_dtype(series.dtype):
+            converted = _downcast_float(series, float32)
+        elif _is_text(series):
+            distinct = series.nunique(dropna=True)
+            if distinct <= max_categories and distinct <= max_category_ratio * max(len(series), 1):
+                converted = series.astype('category')
+            else:
+                converted = series
+        else:
+            converted = series
+        result[column] = converted
+        rows.append({
+            'column': column,
+            'dtype_before': str(series.dtype),
+            'dtype_after': str(converted.dtype),
+            'bytes_before': before,
+            'bytes_after': int(converted.memory_usage(index=False, deep=True)),
+        })
+    report = pd.DataFrame(rows).set_index('column')
+    after = report['bytes_after']
+    report['ratio'] = report['bytes_before'] / after.where(after > 0)
+    return result, report
+
+
+def memory_report(frame):
+    # Bytes per column (deep, so object strings are counted), largest first
+    usage = frame.memory_usage(index=False, deep=True)
+    return usage.sort_values(ascending=False)
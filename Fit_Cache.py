@@ -0,0 +1,215 @@
+'''On-disk cache of fitted preparation parameters keyed by a data fingerprint.
+
+StandardScaler, MinMaxScaler and LabelEncoder in Standardise_Numeric.py and
+Categorical_Field.py, and the IQR bounds in Outliers.py, are refitted on
+every run. FitCache stores the fitted parameters (means, scales, quantiles,
+vocabularies) as small .npz files named after a cheap fingerprint of the
+input: schema, row count and hashes of a few sampled row blocks (or sampled
+byte blocks for files). Re-running on unchanged data loads the parameters
+instead of fitting. Least recently used entries are evicted to keep the
+directory under max_bytes / max_entries.
+
+Example:
+
+    cache = FitCache('.fit_cache')
+    columns = ['Age', 'Salary']
+    scaler = to_sklearn('standard', cached_fit(cache, 'standard', df, columns), columns)
+    df[columns] = scaler.transform(df[columns])
+'''
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SAMPLE_BLOCKS = 8
+BLOCK_ROWS = 1024
+BLOCK_BYTES = 64 * 1024
+
+
+def _frame_fingerprint(frame, hasher, sample_blocks, block_rows):
+    schema = [(str(name), str(dtype)) for name, dtype in frame.dtypes.items()]
+    hasher.update(json.dumps([schema, len(frame)]).encode())
+    starts = np.linspace(0, max(len(frame) - block_rows, 0), sample_blocks).astype(int)
+    for start in np.unique(starts):
+        block = frame.iloc[start:start + block_rows]
+        hasher.update(pd.util.hash_pandas_object(block, index=False).to_numpy().tobytes())
+
+
+def _file_fingerprint(path, hasher, sample_blocks):
+    size = os.path.getsize(path)
+    hasher.update(json.dumps([os.path.basename(str(path)), size]).encode())
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        metadata = pq.ParquetFile(path).metadata
+        hasher.update(str(metadata.schema).encode())
+        hasher.update(str(metadata.num_rows).encode())
+    with open(path, 'rb') as handle:
+        offsets = np.linspace(0, max(size - BLOCK_BYTES, 0), sample_blocks).astype(int)
+        for offset in np.unique(offsets):
+            handle.seek(int(offset))
+            hasher.update(handle.read(BLOCK_BYTES))
+
+
+def npz_arrays(params):
+    '''Arrays for np.savez: object arrays become str, so they load without pickle.'''
+    arrays = {name: np.asarray(value) for name, value in params.items()}
+    return {name: value.astype(str) if value.dtype == object else value
+            for name, value in arrays.items()}
+
+
+def fingerprint(source, sample_blocks=SAMPLE_BLOCKS, block_rows=BLOCK_ROWS):
+    '''Cheap content fingerprint of a DataFrame or a CSV/Parquet file.
+
+    Reads only sample_blocks blocks, so an edit outside the sampled blocks
+    that keeps the schema and row count (or file size) is not detected.
+    '''
+    hasher = hashlib.blake2b(digest_size=16)
+    if isinstance(source, pd.DataFrame):
+        _frame_fingerprint(source, hasher, sample_blocks, block_rows)
+    else:
+        _file_fingerprint(source, hasher, sample_blocks)
+    return hasher.hexdigest()
+
+
+class FitCache:
+    '''Directory of fitted parameter sets with LRU eviction.'''
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, max_entries=1000):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, kind, source, columns=(), **options):
+        parts = json.dumps([kind, list(map(str, columns)), options], sort_keys=True, default=str)
+        suffix = hashlib.blake2b(parts.encode(), digest_size=8).hexdigest()
+        return f'{kind}-{fingerprint(source)}-{suffix}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                params = {name: stored[name] for name in stored.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        self.hits += 1
+        return params
+
+    def put(self, key, params):
+        # params: dict of name -> array-like (numbers or strings, no objects)
+        arrays = npz_arrays(params)
+        tmp_path = self._path(key) + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+        return arrays
+
+    def entries(self):
+        # (path, size, last_used) for each cached entry, oldest first
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                found.append((path, stat.st_size, stat.st_mtime))
+        return sorted(found, key=lambda entry: entry[2])
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            path, size, _ = entries.pop(0)
+            os.remove(path)
+            total -= size
+
+    def get_or_fit(self, kind, source, fit, columns=(), **options):
+        '''Return cached params for (kind, source, columns, options) or fit and store them.'''
+        key = self.key(kind, source, columns, **options)
+        params = self.get(key)
+        if params is None:
+            params = self.put(key, fit())
+        return params
+
+    def stats(self):
+        entries = self.entries()
+        return {'entries': len(entries), 'bytes': sum(size for _, size, _ in entries),
+                'hits': self.hits, 'misses': self.misses}
+
+
+def _fit_standard(frame, columns):
+    values = frame[columns].to_numpy(dtype=np.float64)
+    mean = np.nanmean(values, axis=0)
+    var = np.nanvar(values, axis=0)
+    scale = np.sqrt(var)
+    return {'mean': mean, 'var': var, 'scale': np.where(scale == 0, 1.0, scale),
+            'n_samples': np.sum(~np.isnan(values), axis=0)}
+
+
+def _fit_minmax(frame, columns):
+    values = frame[columns].to_numpy(dtype=np.float64)
+    return {'data_min': np.nanmin(values, axis=0), 'data_max': np.nanmax(values, axis=0)}
+
+
+def _fit_iqr(frame, columns):
+    values = frame[columns].to_numpy(dtype=np.float64)
+    q1, q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+    return {'q1': q1, 'q3': q3}
+
+
+def _fit_label(frame, columns):
+    # One vocabulary; LabelEncoder works on a single column
+    return {'classes': np.unique(frame[columns[0]].dropna().astype(str).to_numpy())}
+
+
+FITTERS = {
+    'standard': _fit_standard,
+    'minmax': _fit_minmax,
+    'iqr': _fit_iqr,
+    'label': _fit_label,
+}
+
+
+def cached_fit(cache, kind, frame, columns):
+    '''Fitted params for one of FITTERS, loaded from cache when the data is unchanged.'''
+    columns = list(columns)
+    return cache.get_or_fit(kind, frame, lambda: FITTERS[kind](frame, columns), columns)
+
+
+def to_sklearn(kind, params, columns):
+    '''Rebuild a fitted StandardScaler, MinMaxScaler or LabelEncoder from params.'''
+    from sklearn.preprocessing import LabelEncoder, MinMaxScaler, StandardScaler
+
+    if kind == 'standard':
+        scaler = StandardScaler()
+        scaler.mean_, scaler.var_, scaler.scale_ = params['mean'], params['var'], params['scale']
+        scaler.n_samples_seen_ = params['n_samples']
+    elif kind == 'minmax':
+        scaler = MinMaxScaler()
+        low, high = scaler.feature_range
+        data_range = params['data_max'] - params['data_min']
+        scaler.data_min_, scaler.data_max_ = params['data_min'], params['data_max']
+        scaler.data_range_ = data_range
+        scaler.scale_ = (high - low) / np.where(data_range == 0, 1.0, data_range)
+        scaler.min_ = low - params['data_min'] * scaler.scale_
+        scaler.n_samples_seen_ = 0
+    elif kind == 'label':
+        encoder = LabelEncoder()
+        encoder.classes_ = params['classes']
+        return encoder
+    else:
+        raise ValueError(f'No scikit-learn object for {kind!r}')
+    scaler.n_features_in_ = len(columns)
+    scaler.feature_names_in_ = np.asarray(columns, dtype=object)
+    return scaler
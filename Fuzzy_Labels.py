@@ -0,0 +1,335 @@
+'''Fuzzy canonicalisation of misspelled categorical labels.
+
+Change_Misleading.py and Categorical_Field.py standardise labels like 'low ',
+'MEDIUM' and '  Medium ' with lower/strip/replace, which cannot fix spelling
+mistakes ('Medum', 'Marrid'). LabelCanonicaliser maps every distinct raw
+value to a canonical label:
+
+1. the column is reduced to its distinct values (Category_Recode.encode);
+2. each value is normalised (case, surrounding and repeated spaces), which
+   resolves exact variants without any distance computation;
+3. the rest are matched against the canonical labels through a character
+   n-gram index: only labels sharing enough n-grams to be within
+   max_distance edits are candidates (the q-gram count filter), and a
+   bounded Levenshtein distance is computed just for those;
+4. the raw -> canonical mapping is cached (and optionally saved), so each
+   distinct raw value is resolved once across runs.
+
+Canonical labels are given, or discovered from the data: normalised values
+are visited from most to least frequent and each one either joins the
+closest existing label or becomes a new one, spelt as its most frequent raw
+form with surrounding and repeated spaces removed ('low ' -> 'low').
+
+With a given label set, the values are matched in batches (one sort finds
+the n-gram candidates of every value in the batch). The distance itself is
+computed per candidate pair, in C by rapidfuzz when it is installed, else by
+a bit-parallel algorithm in Python. That fallback is several times slower:
+resolving millions of distinct values in seconds needs rapidfuzz.
+
+Example:
+
+    fixer = LabelCanonicaliser(['Single', 'Married', 'Divorced'], cache_path='status_labels.npz')
+    df['Status'] = fixer.transform(df['Status'])
+'''
+
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from Category_Recode import encode, recode
+
+try:
+    from rapidfuzz.distance import Levenshtein as _rapidfuzz_levenshtein
+except ImportError:
+    _rapidfuzz_levenshtein = None
+
+# Distinct values matched together against a fixed label set
+MATCH_BATCH = 10_000
+
+
+def normalise_key(value):
+    # Case and whitespace differences never count as edits
+    return ' '.join(str(value).lower().split())
+
+
+def bounded_levenshtein(a, b, limit):
+    '''Edit distance between a and b, or limit + 1 if it is larger than limit.
+
+    Without rapidfuzz this is Myers' bit-parallel algorithm on Python ints:
+    one column of the edit matrix per character of the longer string, with
+    an early exit once the distance can no longer come back under limit.
+    '''
+    if _rapidfuzz_levenshtein is not None:
+        return _rapidfuzz_levenshtein.distance(a, b, score_cutoff=limit)
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > limit:
+        return limit + 1
+    if not b:
+        return len(a)
+    # Bit i of match[char] is set where b[i] == char; b's column is a bit vector
+    match = {}
+    for i, char in enumerate(b):
+        match[char] = match.get(char, 0) | (1 << i)
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    positive, negative, score = mask, 0, len(b)
+    remaining = len(a)
+    for char in a:
+        eq = match.get(char, 0)
+        vertical = eq | negative
+        horizontal = (((eq & positive) + positive) ^ positive) | eq
+        up = negative | (~(horizontal | positive) & mask)
+        down = positive & horizontal
+        if up & last:
+            score += 1
+        elif down & last:
+            score -= 1
+        remaining -= 1
+        if score - remaining > limit:
+            return limit + 1
+        up = ((up << 1) | 1) & mask
+        down = (down << 1) & mask
+        positive = down | (~(vertical | up) & mask)
+        negative = up & vertical
+    return min(score, limit + 1)
+
+
+class NgramIndex:
+    '''Inverted index from character n-grams to labels.'''
+
+    def __init__(self, n=3):
+        self.n = n
+        self.labels = []
+        # Distinct n-gram count and length per label, in buffers that double when full
+        self._sizes = np.empty(64, dtype=np.int64)
+        self._lengths = np.empty(64, dtype=np.int64)
+        self._postings = defaultdict(list)
+        # Posting lists as arrays, rebuilt only for grams that changed
+        self._arrays = {}
+
+    def grams(self, text):
+        padded = f'{" " * (self.n - 1)}{text} '
+        return [padded[i:i + self.n] for i in range(len(padded) - self.n + 1)]
+
+    def add(self, label):
+        position = len(self.labels)
+        grams = set(self.grams(label))
+        self.labels.append(label)
+        if position == self._sizes.size:
+            self._sizes = np.concatenate([self._sizes, np.empty_like(self._sizes)])
+            self._lengths = np.concatenate([self._lengths, np.empty_like(self._lengths)])
+        self._sizes[position] = len(grams)
+        self._lengths[position] = len(label)
+        for gram in grams:
+            self._postings[gram].append(position)
+            self._arrays.pop(gram, None)
+        return position
+
+    def _posting(self, gram):
+        array = self._arrays.get(gram)
+        if array is None:
+            array = self._arrays[gram] = np.asarray(self._postings[gram], dtype=np.int64)
+        return array
+
+    def candidates(self, text, max_distance):
+        '''Labels that share enough n-grams with text to be within max_distance edits.
+
+        Candidates must also be within max_distance of the length of text.
+        When text is so short that max_distance edits could destroy all its
+        n-grams, labels sharing none can still match, so every label is
+        checked (one vectorised pass over the label sizes and lengths).
+        '''
+        distinct = set(self.grams(text))
+        postings = [self._posting(gram) for gram in distinct if gram in self._postings]
+        count = len(self.labels)
+        total = sum(len(posting) for posting in postings)
+        # One edit destroys at most n distinct n-grams of either string (q-gram count filter)
+        budget = self.n * max_distance
+        if len(distinct) <= budget:
+            # Every label may be a candidate: count shared n-grams for all of them
+            shared = np.bincount(np.concatenate(postings), minlength=count) if postings \
+                else np.zeros(count, dtype=np.int64)
+            positions = np.arange(count)
+        elif total:
+            shared_grams = np.concatenate(postings)
+            if count <= 4 * total:
+                shared = np.bincount(shared_grams, minlength=count)
+                positions = np.flatnonzero(shared)
+                shared = shared[positions]
+            else:
+                positions, shared = np.unique(shared_grams, return_counts=True)
+        else:
+            return []
+        needed = np.maximum(self._sizes[positions], len(distinct)) - budget
+        keep = (shared >= needed) & (np.abs(self._lengths[positions] - len(text)) <= max_distance)
+        positions, shared = positions[keep], shared[keep]
+        order = np.argsort(-shared, kind='stable')
+        return [self.labels[p] for p in positions[order]]
+
+    def candidate_pairs(self, texts, limits):
+        '''Filtered (text, label) position pairs for many texts at once.
+
+        The n-gram counts shared by every text and label come from one sort
+        of text * labels + label keys instead of a NumPy call per text. Pairs
+        are ordered by text, then most shared n-grams first, as candidates()
+        orders them. Texts short enough to need every label (see candidates())
+        are returned separately, as a list of positions.
+        '''
+        count = len(self.labels)
+        rows, postings, sizes, short = [], [], [], []
+        for row, (text, limit) in enumerate(zip(texts, limits)):
+            distinct = set(self.grams(text))
+            sizes.append(len(distinct))
+            if len(distinct) <= self.n * limit:
+                short.append(row)
+                continue
+            for gram in distinct:
+                if gram in self._postings:
+                    postings.append(self._posting(gram))
+                    rows.append(row)
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), short
+        lengths = np.fromiter(map(len, postings), dtype=np.int64, count=len(postings))
+        keys = np.repeat(np.asarray(rows, dtype=np.int64), lengths) * count
+        keys += np.concatenate(postings)
+        keys, shared = np.unique(keys, return_counts=True)
+        text_rows, labels = np.divmod(keys, count)
+        limits = np.asarray(limits, dtype=np.int64)[text_rows]
+        text_lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))[text_rows]
+        needed = np.maximum(self._sizes[labels], np.asarray(sizes)[text_rows]) - self.n * limits
+        keep = (shared >= needed) & (np.abs(self._lengths[labels] - text_lengths) <= limits)
+        text_rows, labels, shared = text_rows[keep], labels[keep], shared[keep]
+        order = np.lexsort((-shared, text_rows))
+        return text_rows[order], labels[order], short
+
+
+class LabelCanonicaliser:
+    '''Map raw label spellings to canonical labels.
+
+    A raw value matches a canonical label when their normalised forms are at
+    most max_distance edits apart and at most max_ratio of the label length.
+    Unmatched values are kept as they are (or become new labels when the
+    canonical set is discovered from the data).
+    '''
+
+    def __init__(self, canonical=None, max_distance=2, max_ratio=0.34, ngram=3,
+                 cache_path=None):
+        self.max_distance = max_distance
+        self.max_ratio = max_ratio
+        self.discover = canonical is None
+        self.index = NgramIndex(ngram)
+        self._canonical = {}
+        self.mapping = {}
+        self.cache_path = cache_path
+        for label in canonical or ():
+            self._add_canonical(label)
+        if cache_path and os.path.exists(cache_path):
+            self.load(cache_path)
+
+    def _add_canonical(self, label):
+        key = normalise_key(label)
+        if key not in self._canonical:
+            self._canonical[key] = label
+            self.index.add(key)
+
+    def _match(self, key):
+        if key in self._canonical:
+            return self._canonical[key]
+        limit = min(self.max_distance, int(self.max_ratio * len(key)))
+        if limit == 0:
+            return None
+        best, best_distance = None, limit + 1
+        for candidate in self.index.candidates(key, limit):
+            distance = bounded_levenshtein(key, candidate, min(limit, best_distance - 1))
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+                if distance == 1:
+                    break
+        return self._canonical[best] if best is not None else None
+
+    def _limit(self, key):
+        return min(self.max_distance, int(self.max_ratio * len(key)))
+
+    def _match_many(self, keys):
+        # _match for a batch of keys against a fixed label set
+        result = [self._canonical.get(key) for key in keys]
+        todo = [i for i, label in enumerate(result) if label is None and self._limit(keys[i])]
+        limits = [self._limit(keys[i]) for i in todo]
+        rows, labels, short = self.index.candidate_pairs([keys[i] for i in todo], limits)
+        best = {}
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            found = best.get(row)
+            if found is not None and found[1] == 1:
+                continue
+            bound = limits[row] if found is None else found[1] - 1
+            distance = bounded_levenshtein(keys[todo[row]], self.index.labels[label], bound)
+            if distance <= bound:
+                best[row] = (label, distance)
+        for row, (label, _) in best.items():
+            result[todo[row]] = self._canonical[self.index.labels[label]]
+        for row in short:
+            result[todo[row]] = self._match(keys[todo[row]])
+        return result
+
+    def resolve(self, values, counts=None):
+        '''Resolve distinct raw values into self.mapping; return the new ones resolved.'''
+        pending = [value for value in values if value not in self.mapping]
+        if not self.discover:
+            for start in range(0, len(pending), MATCH_BATCH):
+                batch = pending[start:start + MATCH_BATCH]
+                labels = self._match_many([normalise_key(value) for value in batch])
+                for value, label in zip(batch, labels):
+                    self.mapping[value] = value if label is None else label
+            return len(pending)
+
+        # Discovery: group spellings by key, most frequent key first; a new
+        # label is the key's most frequent spelling once stripped of extra spaces
+        spellings = {}
+        for value in pending:
+            cleaned = ' '.join(str(value).split())
+            weight = 1 if counts is None else counts[value]
+            found = spellings.setdefault(normalise_key(value), {})
+            found[cleaned] = found.get(cleaned, 0) + weight
+        totals = {key: sum(found.values()) for key, found in spellings.items()}
+        labels = {}
+        for key in sorted(spellings, key=totals.get, reverse=True):
+            label = self._match(key)
+            if label is None:
+                found = spellings[key]
+                self._add_canonical(max(found, key=found.get))
+                label = self._canonical[key]
+            labels[key] = label
+        for value in pending:
+            self.mapping[value] = labels[normalise_key(value)]
+        return len(pending)
+
+    def fit(self, series):
+        codes, categories = encode(series)
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        values = categories.tolist()
+        self.resolve(values, dict(zip(values, counts)))
+        if self.cache_path:
+            self.save(self.cache_path)
+        return self
+
+    def transform(self, series, as_category=True):
+        self.fit(series)
+        return recode(series, self.mapping, as_category=as_category)
+
+    @property
+    def canonical(self):
+        return list(self._canonical.values())
+
+    def save(self, path):
+        np.savez_compressed(path, raw=np.array(list(self.mapping), dtype=str),
+                            label=np.array(list(self.mapping.values()), dtype=str),
+                            canonical=np.array(self.canonical, dtype=str))
+
+    def load(self, path):
+        with np.load(path, allow_pickle=False) as stored:
+            for label in stored['canonical'].tolist():
+                self._add_canonical(label)
+            self.mapping.update(zip(stored['raw'].tolist(), stored['label'].tolist()))
+        return self
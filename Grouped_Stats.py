@@ -0,0 +1,224 @@
+'''Per-group standardisation and outlier fences without per-group Python calls.
+
+Standardise_Numeric.py and Outliers.py only use global column statistics,
+and groupby().transform(lambda ...) calls Python once per group, which is
+slow with ~1M stores or sensors. Here the group key is hashed into integer
+codes once (pd.factorize), per-group statistics are computed for all groups
+together with np.bincount / ufunc.at (moments, min/max) or one lexsort
+(exact quantiles), and they are applied back with a gather by group code:
+mean[codes], scale[codes].
+
+GroupedMoments can also be updated chunk by chunk; groups are matched across
+chunks by key and merged with Chan's update.
+
+Example:
+
+    df[['Sales']] = grouped_standardise(df, 'Store', ['Sales'])
+    outliers = df[grouped_iqr_mask(df, 'Sensor', ['Reading'])]
+'''
+
+import numpy as np
+import pandas as pd
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, iter_source
+
+
+def group_codes(frame, by):
+    '''Integer group code per row and the Index of group keys (-1 for missing keys).'''
+    if isinstance(by, (list, tuple)) and len(by) > 1:
+        codes, keys = pd.factorize(pd.MultiIndex.from_frame(frame[list(by)]))
+    else:
+        column = by[0] if isinstance(by, (list, tuple)) else by
+        codes, keys = pd.factorize(frame[column])
+        keys = pd.Index(keys)
+    return codes, keys
+
+
+def _values(frame, columns):
+    return frame[list(columns)].to_numpy(dtype=np.float64)
+
+
+def _chunk_moments(codes, values, n_groups):
+    # Per-group count, mean and M2 for each column, ignoring NaN values
+    valid_rows = codes >= 0
+    codes, values = codes[valid_rows], values[valid_rows]
+    width = values.shape[1]
+    count = np.zeros((n_groups, width))
+    mean = np.zeros((n_groups, width))
+    m2 = np.zeros((n_groups, width))
+    for j in range(width):
+        column = values[:, j]
+        valid = ~np.isnan(column)
+        group, x = codes[valid], column[valid]
+        count[:, j] = np.bincount(group, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            total = np.bincount(group, weights=x, minlength=n_groups)
+            mean[:, j] = np.where(count[:, j] > 0, total / count[:, j], 0.0)
+        deviation = x - mean[group, j]
+        m2[:, j] = np.bincount(group, weights=deviation * deviation, minlength=n_groups)
+    return count, mean, m2
+
+
+class GroupedMoments:
+    '''Per-group count, mean and M2 (plus min and max) for several columns.'''
+
+    def __init__(self, by, columns):
+        self.by = by
+        self.columns = list(columns)
+        self.keys = None
+        width = len(self.columns)
+        self.count = np.zeros((0, width))
+        self.mean = np.zeros((0, width))
+        self.m2 = np.zeros((0, width))
+        self.min = np.zeros((0, width))
+        self.max = np.zeros((0, width))
+
+    def _grow(self, new_keys):
+        extra = len(new_keys)
+        width = len(self.columns)
+        self.keys = new_keys if self.keys is None else self.keys.append(new_keys)
+        self.count = np.vstack([self.count, np.zeros((extra, width))])
+        self.mean = np.vstack([self.mean, np.zeros((extra, width))])
+        self.m2 = np.vstack([self.m2, np.zeros((extra, width))])
+        self.min = np.vstack([self.min, np.full((extra, width), np.inf)])
+        self.max = np.vstack([self.max, np.full((extra, width), -np.inf)])
+
+    def update(self, frame):
+        codes, keys = group_codes(frame, self.by)
+        values = _values(frame, self.columns)
+        count, mean, m2 = _chunk_moments(codes, values, len(keys))
+
+        # Map this chunk's groups onto the accumulated groups, adding new keys
+        if self.keys is None:
+            self._grow(keys[:0])
+        position = self.keys.get_indexer(keys)
+        if (position < 0).any():
+            start = len(self.keys)
+            self._grow(keys[position < 0])
+            position[position < 0] = np.arange(start, len(self.keys))
+
+        total = self.count[position] + count
+        delta = mean - self.mean[position]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, count / total, 0.0)
+            cross = np.where(total > 0, self.count[position] * count / total, 0.0)
+        self.mean[position] += delta * weight
+        self.m2[position] += m2 + delta * delta * cross
+        self.count[position] = total
+
+        rows = codes >= 0
+        for j in range(values.shape[1]):
+            np.fmin.at(self.min[:, j], position[codes[rows]], values[rows, j])
+            np.fmax.at(self.max[:, j], position[codes[rows]], values[rows, j])
+        return self
+
+    def std(self, ddof=0):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan))
+
+    def gather(self, frame):
+        '''Row index into the per-group arrays for each row of frame (-1 if unseen).'''
+        codes, keys = group_codes(frame, self.by)
+        return np.append(self.keys.get_indexer(keys), -1)[codes]
+
+    def to_frame(self, ddof=0):
+        # One row per group with count/mean/std/min/max per column
+        parts = {}
+        for stat, array in (('count', self.count), ('mean', self.mean), ('std', self.std(ddof)),
+                            ('min', self.min), ('max', self.max)):
+            for j, column in enumerate(self.columns):
+                parts[(column, stat)] = array[:, j]
+        return pd.DataFrame(parts, index=self.keys)
+
+
+def grouped_moments(source, by, columns, chunksize=DEFAULT_CHUNKSIZE):
+    moments = GroupedMoments(by, columns)
+    for chunk in iter_source(source, chunksize=chunksize):
+        moments.update(chunk)
+    return moments
+
+
+def _gathered(rows, stat):
+    # stat[rows] with a NaN row for groups the moments have not seen
+    padded = np.vstack([stat, np.full((1, stat.shape[1]), np.nan)])
+    return padded[rows]
+
+
+def grouped_standardise(frame, by, columns, ddof=0, moments=None, method='standard'):
+    '''Standardise columns within each group; rows of unseen groups become NaN.
+
+    method='minmax' scales each group to [0, 1] instead.
+    '''
+    moments = moments or GroupedMoments(by, columns).update(frame)
+    values = _values(frame, columns)
+    if method == 'standard':
+        center, scale = moments.mean, moments.std(ddof)
+    elif method == 'minmax':
+        center, scale = moments.min, moments.max - moments.min
+    else:
+        raise ValueError(f"method must be 'standard' or 'minmax', not {method!r}")
+    scale = np.where((scale == 0) | np.isnan(scale), 1.0, scale)
+    rows = moments.gather(frame)
+    return (values - _gathered(rows, center)) / _gathered(rows, scale)
+
+
+def grouped_zscore_mask(frame, by, columns, threshold=3.0, moments=None, how='any'):
+    # True for rows more than threshold group standard deviations from the group mean
+    moments = moments or GroupedMoments(by, columns).update(frame)
+    values = _values(frame, columns)
+    rows = moments.gather(frame)
+    center = _gathered(rows, moments.mean)
+    std = _gathered(rows, moments.std())
+    with np.errstate(invalid='ignore'):
+        cells = np.abs(values - center) > threshold * std
+    return cells.any(axis=1) if how == 'any' else cells.all(axis=1)
+
+
+def grouped_quantiles(frame, by, column, q):
+    '''Exact per-group quantiles (linear interpolation, as Series.quantile).
+
+    One lexsort orders values inside each group; quantile positions are then
+    computed for all groups at once. Returns (keys, array of shape (groups, len(q))).
+    '''
+    codes, keys = group_codes(frame, by)
+    values = frame[column].to_numpy(dtype=np.float64)
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    order = np.lexsort((values, codes))
+    values = values[order]
+    sizes = np.bincount(codes, minlength=len(keys))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    position = starts[:, None] + q[None, :] * np.maximum(sizes[:, None] - 1, 0)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, starts[:, None] + np.maximum(sizes[:, None] - 1, 0))
+    if values.size == 0:
+        return keys, np.full((len(keys), q.size), np.nan)
+    low = np.minimum(low, values.size - 1)
+    high = np.minimum(high, values.size - 1)
+    fraction = position - low
+    result = values[low] + (values[high] - values[low]) * fraction
+    result[sizes == 0] = np.nan
+    return keys, result
+
+
+def grouped_iqr_fences(frame, by, column, whisker=1.5):
+    # (keys, lower, upper) IQR fences per group
+    keys, quartiles = grouped_quantiles(frame, by, column, [0.25, 0.75])
+    q1, q3 = quartiles[:, 0], quartiles[:, 1]
+    iqr = q3 - q1
+    return keys, q1 - whisker * iqr, q3 + whisker * iqr
+
+
+def grouped_iqr_mask(frame, by, columns, whisker=1.5):
+    '''True for rows outside their group's IQR fences in any of the columns.'''
+    codes, _ = group_codes(frame, by)
+    mask = np.zeros(len(frame), dtype=bool)
+    for column in columns:
+        _, lower, upper = grouped_iqr_fences(frame, by, column, whisker)
+        lower = np.append(lower, np.nan)[codes]
+        upper = np.append(upper, np.nan)[codes]
+        values = frame[column].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            mask |= (values < lower) | (values > upper)
+    return mask
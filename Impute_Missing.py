@@ -0,0 +1,311 @@
+'''One-scan, chunked missing-value imputation.
+
+Change_Misleading.py fills one column at a time with
+df['Salary'].fillna(df['Salary'].mean()) and fillna('Unknown'): a full pass
+to compute each statistic, then a second pass that copies the column. An
+Imputer collects the fill statistics of every column in the same chunked
+scan: means from running moments, medians from a KLL sketch
+(Quantile_Sketch), modes from merged value counts. With by=, the same
+statistics are kept per group (group means through Grouped_Stats, modes from
+(group, value) counts) and rows of groups without a value fall back to the
+column-wide statistic. Group medians come from a bounded uniform sample of
+each group's values (every value gets a random key and each group keeps its
+group_sample smallest keys, one lexsort per chunk); they are exact for
+groups with at most group_sample values and are computed for all groups
+together by Grouped_Stats.grouped_quantiles. At most max_sampled values are
+kept per median column over all groups (16 bytes each, up to about twice
+that between trims): when the groups need more, every group's sample
+shrinks to the same smaller size, so memory stays bounded however many
+rows or small groups the source has (except for one value per group).
+
+transform() then fills each chunk: columns without missing values are not
+touched, and a column with gaps is rebuilt once with a masked write into its
+values array instead of copying the whole frame.
+
+Example:
+
+    imputer = Imputer({'Salary': 'mean', 'Age': 'median', 'Status': 'mode',
+                       'City': 'Unknown'}, by='Department').fit('feed.csv')
+    for chunk in read_chunks('feed.csv'):
+        chunk = imputer.transform(chunk)
+'''
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from Grouped_Stats import GroupedMoments, group_codes, grouped_quantiles
+from Quantile_Sketch import QuantileSketch
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, RunningMoments, iter_source
+
+STATISTICS = ('mean', 'median', 'mode')
+
+
+class _GroupedSample:
+    '''Uniform sample of at most size non-missing values per group, across chunks.
+
+    When the samples of all groups together exceed max_values, size shrinks
+    to the largest value that fits; a sample of the smallest keys stays a
+    uniform sample when fewer of them are kept.
+    '''
+
+    def __init__(self, size, max_values, random_state=None):
+        self.size = size
+        self.max_values = max_values
+        self.codes = np.empty(0, dtype=np.int32)
+        self.values = np.empty(0, dtype=np.float64)
+        self.priority = np.empty(0, dtype=np.float32)
+        self._trimmed = 0
+        self._rng = np.random.default_rng(random_state)
+
+    def update(self, codes, values):
+        keep = (codes >= 0) & ~np.isnan(values)
+        self.codes = np.concatenate([self.codes, codes[keep].astype(np.int32)])
+        self.values = np.concatenate([self.values, values[keep]])
+        self.priority = np.concatenate(
+            [self.priority, self._rng.random(int(keep.sum()), dtype=np.float32)])
+        # Trim only once the buffer has doubled, so the sorting stays amortised O(n log n)
+        if self.codes.size > 2 * max(self._trimmed, self.size):
+            self._trim()
+        return self
+
+    def _trim(self):
+        # One lexsort by (group, key); keep each group's size smallest keys
+        order = np.lexsort((self.priority, self.codes))
+        codes = self.codes[order]
+        first = np.concatenate([[True], codes[1:] != codes[:-1]])
+        position = np.arange(codes.size)
+        rank = position - np.maximum.accumulate(np.where(first, position, 0))
+        counts = np.diff(np.append(np.flatnonzero(first), codes.size))
+        if np.minimum(counts, self.size).sum() > self.max_values:
+            self.size = _fitting_size(counts, self.size, self.max_values)
+        keep = order[rank < self.size]
+        self.codes, self.values, self.priority = (
+            self.codes[keep], self.values[keep], self.priority[keep])
+        self._trimmed = self.codes.size
+
+    def medians(self, keys):
+        '''Median per accumulated group key (NaN for groups without a value).'''
+        self._trim()
+        frame = pd.DataFrame({'group': self.codes, 'value': self.values})
+        groups, medians = grouped_quantiles(frame, 'group', 'value', 0.5)
+        result = np.full(len(keys), np.nan)
+        result[groups.to_numpy(dtype=np.int64)] = medians[:, 0]
+        return pd.Series(result, index=keys)
+
+
+def _fitting_size(counts, size, budget):
+    # Largest per-group size (at least 1) whose samples total at most budget values
+    low, high = 1, size
+    while low < high:
+        middle = (low + high + 1) // 2
+        if np.minimum(counts, middle).sum() <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class Imputer:
+    '''Fill missing values from statistics collected in one chunked scan.
+
+    strategies maps each column to 'mean', 'median', 'mode' or a constant
+    fill value. by (a column or list of columns) makes the statistics
+    per group. k is the size of the median sketches; with by=, each group's
+    median is taken over a uniform sample of at most group_sample values,
+    and at most max_sampled values per column are kept over all groups.
+    '''
+
+    def __init__(self, strategies, by=None, k=200, group_sample=10_000, max_sampled=1_000_000,
+                 random_state=None):
+        self.strategies = dict(strategies)
+        self.by = by
+        self.k = k
+        self.group_sample = group_sample
+        self.max_sampled = max_sampled
+        self.random_state = random_state
+        # Constant fills are known up front; statistics arrive with finish_fit
+        self.fill_values = {column: strategy for column, strategy in self.strategies.items()
+                            if not (isinstance(strategy, str) and strategy in STATISTICS)}
+        self.group_values = {}
+        self.filled = Counter()
+        self._fitted = not any(self._columns(statistic) for statistic in STATISTICS)
+        self._state = None
+
+    def _columns(self, statistic):
+        return [column for column, strategy in self.strategies.items()
+                if isinstance(strategy, str) and strategy == statistic]
+
+    @property
+    def fitted(self):
+        return self._fitted
+
+    def start_fit(self):
+        means, medians, modes = (self._columns(statistic) for statistic in STATISTICS)
+        self._state = {
+            'mean': RunningMoments(means),
+            'median': {column: QuantileSketch(self.k) for column in medians},
+            'mode': {column: None for column in modes},
+        }
+        if self.by is not None:
+            self._state['group_mean'] = GroupedMoments(self.by, means) if means else None
+            self._state['group_keys'] = None
+            self._state['group_median'] = {
+                column: _GroupedSample(self.group_sample, self.max_sampled, self.random_state)
+                for column in medians}
+            self._state['group_mode'] = {column: None for column in modes}
+        return self
+
+    def partial_fit(self, chunk):
+        state = self._state
+        means = state['mean'].columns
+        if means:
+            state['mean'].update(chunk[means].to_numpy(dtype=np.float64))
+        for column, sketch in state['median'].items():
+            sketch.update(chunk[column].to_numpy(dtype=np.float64))
+        for column in state['mode']:
+            state['mode'][column] = _add_counts(state['mode'][column], chunk[column].value_counts())
+        if self.by is None:
+            return self
+
+        if state['group_mean'] is not None:
+            state['group_mean'].update(chunk)
+        by = [self.by] if isinstance(self.by, str) else list(self.by)
+        for column in state['group_mode']:
+            state['group_mode'][column] = _add_counts(state['group_mode'][column],
+                                                      chunk[by + [column]].value_counts())
+        if state['group_median']:
+            # Map this chunk's group codes onto the accumulated keys, adding new ones
+            codes, keys = group_codes(chunk, self.by)
+            if state['group_keys'] is None:
+                state['group_keys'] = keys[:0]
+            position = state['group_keys'].get_indexer(keys)
+            if (position < 0).any():
+                start = len(state['group_keys'])
+                state['group_keys'] = state['group_keys'].append(keys[position < 0])
+                position[position < 0] = np.arange(start, len(state['group_keys']))
+            codes = np.append(position, -1)[codes]
+            for column, sample in state['group_median'].items():
+                sample.update(codes, chunk[column].to_numpy(dtype=np.float64))
+        return self
+
+    def finish_fit(self):
+        state = self._state
+        for i, column in enumerate(state['mean'].columns):
+            self.fill_values[column] = state['mean'].mean[i] if state['mean'].count[i] else np.nan
+        for column, sketch in state['median'].items():
+            self.fill_values[column] = sketch.quantile(0.5) if sketch.count else np.nan
+        for column, counts in state['mode'].items():
+            self.fill_values[column] = _mode(counts)
+
+        if self.by is not None:
+            moments = state['group_mean']
+            if moments is not None:
+                for i, column in enumerate(moments.columns):
+                    mean = np.where(moments.count[:, i] > 0, moments.mean[:, i], np.nan)
+                    self.group_values[column] = pd.Series(mean, index=moments.keys)
+            for column, sample in state['group_median'].items():
+                keys = state['group_keys']
+                self.group_values[column] = sample.medians(pd.Index([]) if keys is None else keys)
+            for column, counts in state['group_mode'].items():
+                self.group_values[column] = _group_mode(counts)
+        self._state = None
+        self._fitted = True
+        return self
+
+    def fit(self, source, chunksize=DEFAULT_CHUNKSIZE):
+        self.start_fit()
+        for chunk in iter_source(source, chunksize=chunksize):
+            self.partial_fit(chunk)
+        return self.finish_fit()
+
+    def _row_fills(self, chunk, column, missing):
+        # Fill value per missing row: the group's value, else the column-wide one
+        fallback = self.fill_values[column]
+        per_group = self.group_values.get(column)
+        if per_group is None:
+            return fallback
+        codes, keys = group_codes(chunk, self.by)
+        lookup = per_group.reindex(keys).to_numpy(dtype=object)
+        fills = np.append(lookup, np.nan)[codes[missing]]
+        unresolved = pd.isna(fills)
+        fills[unresolved] = fallback
+        return fills
+
+    def transform(self, chunk, inplace=False):
+        '''Fill missing values; only columns that have gaps are rewritten.'''
+        if not inplace:
+            chunk = chunk.copy(deep=False)
+        for column in self.strategies:
+            series = chunk[column]
+            missing = series.isna().to_numpy()
+            count = int(missing.sum())
+            if not count:
+                continue
+            fills = self._row_fills(chunk, column, missing)
+            chunk[column] = _filled(series, missing, fills)
+            self.filled[column] += count
+        return chunk
+
+    def fit_transform(self, frame):
+        return self.fit(frame, chunksize=max(len(frame), 1)).transform(frame)
+
+
+def _add_counts(total, counts):
+    return counts if total is None else total.add(counts, fill_value=0)
+
+
+def _mode(counts):
+    # Most frequent value; ties go to the smallest value, as Series.mode()[0]
+    if counts is None or counts.empty:
+        return np.nan
+    counts = counts.sort_index().sort_values(ascending=False, kind='stable')
+    return counts.index[0]
+
+
+def _group_mode(counts):
+    '''Per-group mode from counts indexed by (group keys..., value).'''
+    if counts is None or counts.empty:
+        return pd.Series(dtype=object)
+    counts = counts.sort_index().sort_values(ascending=False, kind='stable')
+    frame = counts.index.to_frame(index=False)
+    group_levels = list(frame.columns[:-1])
+    first = ~frame.duplicated(subset=group_levels).to_numpy()
+    winners = frame[first]
+    if len(group_levels) == 1:
+        index = pd.Index(winners[group_levels[0]])
+    else:
+        index = pd.MultiIndex.from_frame(winners[group_levels])
+    return pd.Series(winners[frame.columns[-1]].to_numpy(dtype=object), index=index)
+
+
+def _filled(series, missing, fills):
+    '''The column with missing positions replaced, written into one new buffer.'''
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind == 'f':
+        try:
+            numeric = np.asarray(fills, dtype=series.dtype)
+        except (TypeError, ValueError):
+            numeric = None
+        if numeric is not None:
+            values = series.to_numpy(dtype=series.dtype, copy=True)
+            values[missing] = numeric
+            return pd.Series(values, index=series.index, name=series.name)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new = pd.Index(pd.unique(np.atleast_1d(np.asarray(fills, dtype=object))))
+        new = new[pd.notna(new) & ~new.isin(series.cat.categories)]
+        if len(new):
+            series = series.cat.add_categories(new)
+    values = series.to_numpy(dtype=object, copy=True)
+    values[missing] = fills
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical(values, categories=series.cat.categories),
+                         index=series.index, name=series.name)
+    result = pd.Series(values, index=series.index, name=series.name).infer_objects()
+    if not isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iufb':
+        # Keep nullable numbers (Int64, Float64, boolean) when the fills fit the dtype
+        try:
+            return result.astype(series.dtype)
+        except (TypeError, ValueError):
+            return result.convert_dtypes()
+    return result
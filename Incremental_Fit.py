@@ -0,0 +1,188 @@
+'''Incremental (partial_fit) scalers, encoders and IQR fences for append-only data.
+
+The StandardScaler / MinMaxScaler flows in Standardise_Numeric.py and the
+LabelEncoder flows in Categorical_Field.py can only refit on the whole
+dataset. The classes here keep mergeable state instead (running moments,
+running min/max, a vocabulary that only grows, quantile sketches for the
+Outliers.py IQR fences), fold each new batch in with partial_fit, and save
+that state to a small .npz file, so a daily refresh costs O(new rows).
+
+Example:
+
+    scaler = load_state('age_scaler.npz')          # yesterday's state
+    refresh('appended_today.csv', scaler)          # O(new rows)
+    save_state(scaler, 'age_scaler.npz')
+    df[['Age', 'Salary']] = scaler.transform(df)
+'''
+
+import numpy as np
+import pandas as pd
+
+from Category_Recode import encode
+from Fit_Cache import npz_arrays
+from Quantile_Sketch import QuantileSketch
+from Streaming_Outliers import iqr_fences
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, RunningMoments, iter_source
+
+
+class IncrementalStandardScaler:
+    '''StandardScaler built from running count/mean/M2.'''
+
+    kind = 'standard'
+
+    def __init__(self, columns, ddof=0):
+        self.columns = list(columns)
+        self.ddof = ddof
+        self.moments = RunningMoments(self.columns)
+
+    def partial_fit(self, frame):
+        self.moments.update(frame[self.columns].to_numpy(dtype=np.float64))
+        return self
+
+    def transform(self, frame):
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        return (values - self.moments.mean) / self.moments.scale(self.ddof)
+
+    def state(self):
+        return {'columns': self.columns, 'ddof': self.ddof, 'count': self.moments.count,
+                'mean': self.moments.mean, 'm2': self.moments.m2}
+
+    @classmethod
+    def from_state(cls, state):
+        scaler = cls(state['columns'].tolist(), int(state['ddof']))
+        scaler.moments.count = state['count'].astype(np.int64)
+        scaler.moments.mean = state['mean'].astype(np.float64)
+        scaler.moments.m2 = state['m2'].astype(np.float64)
+        return scaler
+
+
+class IncrementalMinMaxScaler:
+    '''MinMaxScaler built from running per-column min and max.'''
+
+    kind = 'minmax'
+
+    def __init__(self, columns, feature_range=(0, 1)):
+        self.columns = list(columns)
+        self.feature_range = tuple(feature_range)
+        self.data_min = np.full(len(self.columns), np.inf)
+        self.data_max = np.full(len(self.columns), -np.inf)
+
+    def partial_fit(self, frame):
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        if len(values):
+            self.data_min = np.fmin(self.data_min, np.nanmin(values, axis=0))
+            self.data_max = np.fmax(self.data_max, np.nanmax(values, axis=0))
+        return self
+
+    def transform(self, frame):
+        low, high = self.feature_range
+        data_range = self.data_max - self.data_min
+        data_range = np.where(data_range == 0, 1.0, data_range)
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        return (values - self.data_min) / data_range * (high - low) + low
+
+    def state(self):
+        return {'columns': self.columns, 'feature_range': self.feature_range,
+                'data_min': self.data_min, 'data_max': self.data_max}
+
+    @classmethod
+    def from_state(cls, state):
+        scaler = cls(state['columns'].tolist(), state['feature_range'].tolist())
+        scaler.data_min = state['data_min'].astype(np.float64)
+        scaler.data_max = state['data_max'].astype(np.float64)
+        return scaler
+
+
+class GrowingLabelEncoder:
+    '''LabelEncoder whose vocabulary only grows.
+
+    New labels are appended in order of first appearance, so codes handed out
+    earlier stay valid (unlike LabelEncoder, which re-sorts its classes).
+    Labels never seen transform to -1.
+    '''
+
+    kind = 'label'
+
+    def __init__(self, column):
+        self.column = column
+        self.classes = pd.Index([], dtype=object)
+
+    def partial_fit(self, frame):
+        _, categories = encode(frame[self.column])
+        new = categories.astype(str).difference(self.classes, sort=False)
+        if len(new):
+            self.classes = self.classes.append(pd.Index(new, dtype=object))
+        return self
+
+    def transform(self, frame):
+        codes, categories = encode(frame[self.column])
+        table = self.classes.get_indexer(categories.astype(str))
+        return np.append(table, -1)[codes]
+
+    def inverse_transform(self, codes):
+        return self.classes.to_numpy()[np.asarray(codes)]
+
+    def state(self):
+        return {'columns': [self.column], 'classes': self.classes.to_numpy(dtype=str)}
+
+    @classmethod
+    def from_state(cls, state):
+        encoder = cls(str(state['columns'][0]))
+        encoder.classes = pd.Index(state['classes'].tolist(), dtype=object)
+        return encoder
+
+
+class IncrementalIQR:
+    '''IQR fences from one quantile sketch per column.'''
+
+    kind = 'iqr'
+
+    def __init__(self, columns, k=200):
+        self.columns = list(columns)
+        self.sketches = {column: QuantileSketch(k) for column in self.columns}
+
+    def partial_fit(self, frame):
+        for column in self.columns:
+            self.sketches[column].update(frame[column].to_numpy(dtype=np.float64))
+        return self
+
+    def fences(self, whisker=1.5):
+        return iqr_fences(self.sketches, whisker)
+
+    def state(self):
+        state = {'columns': self.columns}
+        for i, column in enumerate(self.columns):
+            for name, array in self.sketches[column].to_arrays().items():
+                state[f'sketch{i}_{name}'] = array
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        fences = cls(state['columns'].tolist())
+        for i, column in enumerate(fences.columns):
+            prefix = f'sketch{i}_'
+            arrays = {name[len(prefix):]: state[name] for name in state if name.startswith(prefix)}
+            fences.sketches[column] = QuantileSketch.from_arrays(arrays)
+        return fences
+
+
+KINDS = {cls.kind: cls for cls in
+         (IncrementalStandardScaler, IncrementalMinMaxScaler, GrowingLabelEncoder, IncrementalIQR)}
+
+
+def save_state(fitted, path):
+    np.savez_compressed(path, kind=fitted.kind, **npz_arrays(fitted.state()))
+
+
+def load_state(path):
+    with np.load(path, allow_pickle=False) as stored:
+        state = {name: stored[name] for name in stored.files}
+    return KINDS[str(state.pop('kind'))].from_state(state)
+
+
+def refresh(source, *fitted, chunksize=DEFAULT_CHUNKSIZE):
+    '''Fold new rows into every fitted object in a single pass over source.'''
+    for chunk in iter_source(source, chunksize=chunksize):
+        for item in fitted:
+            item.partial_fit(chunk)
+    return fitted
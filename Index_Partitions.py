@@ -0,0 +1,178 @@
+'''Global row IDs for chunked, multi-file and multi-worker data.
+
+Add_an_Index.py uses df['Index'] = df.index + 1 or reset_index(), which
+assumes one in-memory frame with a clean RangeIndex and copies it. Here every
+partition (file, row group or chunk) gets a base offset from a prefix sum of
+partition sizes. Sizes come from file metadata (Parquet footers, Feather
+batch lengths) or a newline count for CSV, so no global sort and no full
+parse is needed, and each worker can number its own partition independently.
+
+IDs are handed out as RowIdRange objects, which are just (start, stop) and
+become a pandas RangeIndex (no int64 array) until a real column is asked for.
+When partition sizes are not known up front, composite_ids packs
+(partition, position) into one int64 instead.
+
+Example:
+
+    for path, ids in zip(paths, file_id_ranges(paths, start=1)):
+        ...                                # hand (path, ids) to a worker
+    for chunk in iter_with_ids(paths, column='Index'):
+        ...
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, read_chunks
+
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+# Bits for the position inside a partition in composite ids (~1.1e12 rows)
+POSITION_BITS = 40
+
+
+class RowIdRange:
+    '''Lazy, contiguous block of row IDs [start, stop).'''
+
+    __slots__ = ('start', 'stop')
+
+    def __init__(self, start, stop):
+        self.start = int(start)
+        self.stop = int(stop)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __repr__(self):
+        return f'RowIdRange({self.start}, {self.stop})'
+
+    def __eq__(self, other):
+        return (isinstance(other, RowIdRange)
+                and (self.start, self.stop) == (other.start, other.stop))
+
+    def split(self, sizes):
+        # Consecutive sub-ranges of the given sizes (e.g. chunks of a file)
+        bounds = self.start + np.concatenate([[0], np.cumsum(sizes)])
+        if bounds[-1] > self.stop:
+            raise ValueError('Sub-range sizes exceed the range')
+        return [RowIdRange(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def to_index(self, name=None):
+        return pd.RangeIndex(self.start, self.stop, name=name)
+
+    def to_numpy(self, dtype=np.int64):
+        return np.arange(self.start, self.stop, dtype=dtype)
+
+
+def _csv_rows(path, header=True):
+    count = 0
+    last = b'\n'
+    with open(path, 'rb') as handle:
+        while block := handle.read(CSV_BLOCK_BYTES):
+            count += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        count += 1
+    return count - (1 if header and count else 0)
+
+
+def file_rows(path):
+    '''Row count from metadata where the format has it, else a newline count.
+
+    The CSV count assumes no quoted field contains a newline.
+    '''
+    lowered = str(path).lower()
+    if lowered.endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    if lowered.endswith(('.feather', '.arrow', '.ipc')):
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    return _csv_rows(path)
+
+
+def row_group_rows(path):
+    # Rows per Parquet row group, read from the footer only
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(path).metadata
+    return [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+
+
+def partition_offsets(sizes, start=0):
+    '''First ID of each partition: an exclusive prefix sum of the sizes.'''
+    sizes = np.asarray(sizes, dtype=np.int64)
+    offsets = np.empty(len(sizes), dtype=np.int64)
+    offsets[:1] = start
+    np.cumsum(sizes[:-1], out=offsets[1:])
+    offsets[1:] += start
+    return offsets
+
+
+def id_ranges(sizes, start=0):
+    offsets = partition_offsets(sizes, start)
+    return [RowIdRange(offset, offset + size) for offset, size in zip(offsets, sizes)]
+
+
+def file_id_ranges(paths, start=0, workers=1):
+    '''RowIdRange per file, from metadata-only row counts (optionally in threads).'''
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(workers) as pool:
+            sizes = list(pool.map(file_rows, paths))
+    else:
+        sizes = [file_rows(path) for path in paths]
+    return id_ranges(sizes, start)
+
+
+def assign_ids(chunk, ids, column=None):
+    '''Attach IDs to a chunk: as its RangeIndex (lazy) or as a materialised column.'''
+    if len(ids) != len(chunk):
+        raise ValueError(f'{len(ids)} IDs for a chunk of {len(chunk)} rows')
+    chunk = chunk.copy(deep=False)
+    if column is None:
+        chunk.index = ids.to_index()
+    else:
+        chunk[column] = ids.to_numpy()
+    return chunk
+
+
+def iter_chunk_ids(chunks, start=0):
+    # (chunk, RowIdRange) pairs for a sequential stream of chunks
+    offset = start
+    for chunk in chunks:
+        yield chunk, RowIdRange(offset, offset + len(chunk))
+        offset += len(chunk)
+
+
+def iter_with_ids(paths, start=0, column=None, chunksize=DEFAULT_CHUNKSIZE, ranges=None):
+    '''Chunks of several files, numbered globally.
+
+    Each file starts at its own precomputed offset, so files can also be
+    processed out of order or by different workers (pass their ranges).
+    '''
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    ranges = ranges or file_id_ranges(paths, start)
+    for path, file_range in zip(paths, ranges):
+        chunks = read_chunks(path, chunksize=chunksize)
+        for chunk, ids in iter_chunk_ids(chunks, file_range.start):
+            yield assign_ids(chunk, ids, column)
+
+
+def composite_ids(partition, local_start, count, position_bits=POSITION_BITS):
+    '''IDs packed as (partition << position_bits) | position, needing no counts.
+
+    Unique across partitions and increasing within a partition; ordered
+    globally if partitions are numbered in data order.
+    '''
+    if local_start + count > 1 << position_bits:
+        raise ValueError('Partition too large for position_bits')
+    base = np.int64(partition) << np.int64(position_bits)
+    return base + np.arange(local_start, local_start + count, dtype=np.int64)
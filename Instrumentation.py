@@ -0,0 +1,338 @@
+'''Per-stage instrumentation for the preparation steps.
+
+When a prep job is slow it is not obvious whether the time goes into the
+.str.lower().str.strip() chain, a row-wise apply or the quantile sorts.
+Steps report to this module through span(stage, rows_in=...): while a
+Recorder is active, each span records rows in/out, elapsed time, net bytes
+allocated and peak traced memory (tracemalloc), and an optional sampling
+profiler thread snapshots the Python stack every few milliseconds and
+attributes the samples to the open stage. tracemalloc's peak is one
+process-wide counter that each span resets, so memory is recorded only for
+spans on the thread that started the recorder; spans on other threads
+(prefetch readers, writers, worker pools) get timings and row counts only,
+and the main thread's peaks still include what other threads allocate
+meanwhile. With no active recorder, span() costs one attribute lookup.
+Memory tracing slows allocation-heavy stages (CSV writing in particular);
+use memory=False when only timings matter.
+
+Results are exported as JSON metrics, a Chrome/Perfetto trace
+(chrome://tracing) or collapsed stacks for flame graphs. Setting
+PREP_TRACE=/path/trace.json records a whole run and writes the trace at exit
+without touching the code; instrument_functions() wraps functions of other
+modules (e.g. 'Category_Recode.recode') at runtime.
+
+Example:
+
+    with recording(memory=True, profile=True) as recorder:
+        pipeline.run('feed.csv', 'prepared.parquet')
+    print(recorder.summary())
+    recorder.write_chrome_trace('prep_trace.json')
+'''
+
+import atexit
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+_active = None
+
+
+class Span:
+    '''One timed execution of a stage.'''
+
+    __slots__ = ('stage', 'rows_in', 'rows_out', 'start', 'elapsed', 'bytes_allocated',
+                 'peak_bytes', 'thread', 'depth', '_peak_seen', '_current_start')
+
+    def __init__(self, stage, rows_in, depth):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.depth = depth
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.bytes_allocated = None
+        self.peak_bytes = None
+        self._peak_seen = 0
+        self._current_start = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in
+                ('stage', 'rows_in', 'rows_out', 'start', 'elapsed', 'bytes_allocated',
+                 'peak_bytes', 'thread', 'depth')}
+
+
+class _NullSpan:
+    rows_out = None
+
+
+class StackSampler(threading.Thread):
+    '''Sample one thread's Python stack at a fixed interval.'''
+
+    def __init__(self, recorder, thread_id, interval):
+        super().__init__(name='prep-stack-sampler', daemon=True)
+        self.recorder = recorder
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            open_spans = self.recorder._stacks.get(self.thread_id)
+            stage = open_spans[-1].stage if open_spans else '<no stage>'
+            self.recorder.samples[stage][';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Recorder:
+    '''Collects spans (and optional stack samples) from every reporting step.'''
+
+    def __init__(self, memory=True, profile=False, sample_interval=0.005):
+        self.memory = memory
+        self.profile = profile
+        self.sample_interval = sample_interval
+        self.spans = []
+        self.samples = defaultdict(Counter)
+        self._stacks = defaultdict(list)
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._memory_thread = None
+        self.origin = time.perf_counter()
+
+    def _tracing(self):
+        # Only the starting thread may reset the process-wide tracemalloc peak
+        return (self.memory and tracemalloc.is_tracing()
+                and threading.get_ident() == self._memory_thread)
+
+    def start(self):
+        self._memory_thread = threading.get_ident()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.profile:
+            self._sampler = StackSampler(self, threading.get_ident(), self.sample_interval)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return self
+
+    def _open(self, stage, rows_in):
+        stack = self._stacks[threading.get_ident()]
+        span = Span(stage, rows_in, len(stack))
+        if self._tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]._peak_seen = max(stack[-1]._peak_seen, peak)
+            tracemalloc.reset_peak()
+            span._current_start = current
+        stack.append(span)
+        return span
+
+    def _close(self, span):
+        span.elapsed = time.perf_counter() - span.start
+        stack = self._stacks[threading.get_ident()]
+        stack.pop()
+        if self._tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            span.peak_bytes = max(span._peak_seen, peak)
+            span.bytes_allocated = current - span._current_start
+            if stack:
+                stack[-1]._peak_seen = max(stack[-1]._peak_seen, span.peak_bytes)
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        '''Per-stage totals, slowest first.'''
+        totals = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.stage, {
+                'stage': span.stage, 'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                'bytes_allocated': 0, 'peak_bytes': 0, 'samples': 0})
+            entry['calls'] += 1
+            entry['seconds'] += span.elapsed
+            entry['rows_in'] += span.rows_in or 0
+            entry['rows_out'] += span.rows_out or 0
+            entry['bytes_allocated'] += span.bytes_allocated or 0
+            entry['peak_bytes'] = max(entry['peak_bytes'], span.peak_bytes or 0)
+        for stage, counter in self.samples.items():
+            if stage in totals:
+                totals[stage]['samples'] = sum(counter.values())
+        for entry in totals.values():
+            seconds = entry['seconds']
+            entry['rows_per_second'] = entry['rows_in'] / seconds if seconds else None
+        return sorted(totals.values(), key=lambda entry: entry['seconds'], reverse=True)
+
+    def hot_functions(self, stage=None, top=10):
+        # Most sampled innermost frames, optionally for one stage
+        counter = Counter()
+        for name, stacks in self.samples.items():
+            if stage is None or name == stage:
+                for stack, count in stacks.items():
+                    counter[stack.rsplit(';', 1)[-1]] += count
+        return counter.most_common(top)
+
+    def write_json(self, path):
+        with open(path, 'w') as handle:
+            hot = {stage: self.hot_functions(stage) for stage in self.samples}
+            json.dump({'summary': self.summary(),
+                       'spans': [span.to_dict() for span in self.spans],
+                       'hot_functions': hot},
+                      handle, indent=2)
+
+    def write_chrome_trace(self, path):
+        '''Trace Event Format, for chrome://tracing or ui.perfetto.dev.'''
+        pid = os.getpid()
+        events = [{
+            'name': span.stage, 'ph': 'X', 'pid': pid, 'tid': span.thread,
+            'ts': (span.start - self.origin) * 1e6, 'dur': span.elapsed * 1e6,
+            'args': {'rows_in': span.rows_in, 'rows_out': span.rows_out,
+                     'bytes_allocated': span.bytes_allocated, 'peak_bytes': span.peak_bytes},
+        } for span in self.spans]
+        with open(path, 'w') as handle:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, handle)
+
+    def write_collapsed(self, path):
+        # One 'stage;frame;frame count' line per stack, for flamegraph.pl / speedscope
+        with open(path, 'w') as handle:
+            for stage, stacks in self.samples.items():
+                for stack, count in stacks.items():
+                    handle.write(f'{stage};{stack} {count}\n')
+
+
+def get_recorder():
+    return _active
+
+
+@contextmanager
+def recording(memory=True, profile=False, sample_interval=0.005):
+    '''Activate a Recorder for the duration of the block.'''
+    global _active
+    previous = _active
+    recorder = Recorder(memory, profile, sample_interval).start()
+    _active = recorder
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        _active = previous
+
+
+def _rows(value):
+    # Row count of frames, series and arrays; None for anything else
+    shape = getattr(value, 'shape', None)
+    return shape[0] if shape else None
+
+
+@contextmanager
+def span(stage, rows_in=None):
+    '''Report one execution of stage; set .rows_out on the yielded span.'''
+    recorder = _active
+    if recorder is None:
+        yield _NullSpan()
+        return
+    opened = recorder._open(stage, rows_in)
+    try:
+        yield opened
+    finally:
+        recorder._close(opened)
+
+
+def instrumented(stage=None):
+    '''Decorator: report each call as a span.
+
+    rows_in is taken from the first frame/array argument, rows_out from the
+    result (or the first item of a tuple result).
+    '''
+    def decorate(func):
+        name = stage or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            rows_in = next((rows for rows in map(_rows, args) if rows is not None), None)
+            with span(name, rows_in) as opened:
+                result = func(*args, **kwargs)
+                opened.rows_out = _rows(result[0] if isinstance(result, tuple) else result)
+            return result
+
+        wrapper.__wrapped_stage__ = name
+        return wrapper
+
+    return decorate
+
+
+def instrument_functions(targets):
+    '''Wrap functions or methods named 'Module.func' or 'Module.Class.method' in place.
+
+    Modules that already did `from Module import func` are patched too.
+    '''
+    for target in targets:
+        module_name, _, attribute_path = target.partition('.')
+        owner = importlib.import_module(module_name)
+        *parents, name = attribute_path.split('.')
+        for parent in parents:
+            owner = getattr(owner, parent)
+        func = getattr(owner, name)
+        if hasattr(func, '__wrapped_stage__'):
+            continue
+        wrapper = instrumented(target)(func)
+        setattr(owner, name, wrapper)
+        if not parents:
+            for module in list(sys.modules.values()):
+                if getattr(module, name, None) is func:
+                    setattr(module, name, wrapper)
+
+
+_env_recorder = None
+
+
+def enable_from_env(variable='PREP_TRACE'):
+    '''Start recording if PREP_TRACE names an output file; write it at exit.
+
+    PREP_TRACE_PROFILE=1 also enables the sampling profiler, and
+    PREP_TRACE_FUNCTIONS=Module.func,... wraps extra functions.
+    '''
+    global _active, _env_recorder
+    path = os.environ.get(variable)
+    if not path or _env_recorder is not None:
+        return _env_recorder
+    functions = os.environ.get(variable + '_FUNCTIONS')
+    if functions:
+        instrument_functions(name.strip() for name in functions.split(',') if name.strip())
+    _env_recorder = Recorder(profile=os.environ.get(variable + '_PROFILE') == '1').start()
+    _active = _env_recorder
+
+    def _write():
+        _env_recorder.stop()
+        _env_recorder.write_chrome_trace(path)
+        _env_recorder.write_json(os.path.splitext(path)[0] + '.metrics.json')
+
+    atexit.register(_write)
+    return _env_recorder
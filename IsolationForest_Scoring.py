@@ -0,0 +1,140 @@
+'''Fit-once, score-anywhere Isolation Forest for large tables.
+
+Outliers.py fits IsolationForest(contamination=0.2) on the full frame and
+adds an 'Outlier' column with fit_predict. Here the forest is fitted on a
+bounded random subsample (reservoir-sampled across chunks, so the source is
+never loaded whole), saved to disk, and later used to score arbitrarily large
+inputs chunk by chunk, either serially or across a process pool where each
+worker loads the saved forest once. Only the anomaly rows and their scores
+come back; no column is added to a copy of the input.
+
+Example:
+
+    scorer = ForestScorer.fit('history.parquet', ['Age', 'Salary'], contamination=0.2)
+    scorer.save('forest.joblib')
+
+    scorer = ForestScorer.load('forest.joblib')
+    for anomalies in scorer.score_chunks('nightly.parquet', workers=32):
+        ...
+'''
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, iter_source
+
+SCORE_COLUMN = 'anomaly_score'
+
+
+def reservoir_sample(source, columns, size, random_state=None, chunksize=DEFAULT_CHUNKSIZE):
+    '''Uniform sample of up to size rows from a chunked source in one pass.
+
+    Every row gets a random key and the size smallest keys are kept, which is
+    equivalent to reservoir sampling but vectorised per chunk.
+    '''
+    rng = np.random.default_rng(random_state)
+    sample = np.empty((0, len(columns)), dtype=np.float64)
+    keys = np.empty(0, dtype=np.float64)
+    for chunk in iter_source(source, columns=list(columns), chunksize=chunksize):
+        sample = np.vstack([sample, chunk[list(columns)].to_numpy(dtype=np.float64)])
+        keys = np.concatenate([keys, rng.random(len(chunk))])
+        if keys.size > size:
+            keep = np.argpartition(keys, size)[:size]
+            sample, keys = sample[keep], keys[keep]
+    return sample
+
+
+class ForestScorer:
+    '''A fitted IsolationForest plus the columns it was trained on.'''
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = list(columns)
+
+    @classmethod
+    def fit(cls, source, columns, sample_size=100_000, contamination=0.2,
+            random_state=None, chunksize=DEFAULT_CHUNKSIZE, **forest_kwargs):
+        sample = reservoir_sample(source, columns, sample_size, random_state, chunksize)
+        model = IsolationForest(contamination=contamination, random_state=random_state,
+                                **forest_kwargs)
+        model.fit(sample)
+        return cls(model, columns)
+
+    def save(self, path):
+        joblib.dump({'model': self.model, 'columns': self.columns}, path)
+
+    @classmethod
+    def load(cls, path):
+        state = joblib.load(path)
+        return cls(state['model'], state['columns'])
+
+    def score_values(self, values):
+        '''Positions and decision scores of the anomalies in a 2-D block.
+
+        Scores follow decision_function: negative means anomalous.
+        '''
+        scores = self.model.decision_function(values)
+        positions = np.flatnonzero(scores < 0)
+        return positions, scores[positions]
+
+    def _anomalies(self, chunk, positions, scores):
+        anomalies = chunk.iloc[positions].copy()
+        anomalies[SCORE_COLUMN] = scores
+        return anomalies
+
+    def score_chunks(self, source, workers=1, model_path=None, chunksize=DEFAULT_CHUNKSIZE):
+        '''Yield the anomaly rows of each chunk with an anomaly_score column.
+
+        workers=1 scores in this process as a streaming iterator. With more
+        workers, chunks are scored in a process pool; pass model_path (a file
+        written by save) so workers load the forest once instead of receiving
+        it with every task. At most 2 x workers chunks are in flight.
+        '''
+        if workers == 1:
+            for chunk in iter_source(source, chunksize=chunksize):
+                values = chunk[self.columns].to_numpy(dtype=np.float64)
+                yield self._anomalies(chunk, *self.score_values(values))
+            return
+
+        workers = workers or os.cpu_count() or 1
+        if model_path is None:
+            initargs = (None, self)
+        else:
+            initargs = (model_path, None)
+        pending = deque()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            for chunk in iter_source(source, chunksize=chunksize):
+                values = chunk[self.columns].to_numpy(dtype=np.float64)
+                pending.append((chunk, pool.submit(_score_task, values)))
+                if len(pending) >= 2 * workers:
+                    chunk, task = pending.popleft()
+                    yield self._anomalies(chunk, *task.result())
+            while pending:
+                chunk, task = pending.popleft()
+                yield self._anomalies(chunk, *task.result())
+
+    def score(self, source, workers=1, model_path=None, chunksize=DEFAULT_CHUNKSIZE):
+        # All anomaly rows from the source as one (small) DataFrame
+        parts = list(self.score_chunks(source, workers, model_path, chunksize))
+        return pd.concat(parts) if parts else pd.DataFrame(columns=self.columns + [SCORE_COLUMN])
+
+
+# Per-process forest set by the pool initializer
+_worker_scorer = None
+
+
+def _init_worker(model_path, scorer):
+    global _worker_scorer
+    _worker_scorer = ForestScorer.load(model_path) if model_path else scorer
+    # The pool already provides the parallelism
+    _worker_scorer.model.set_params(n_jobs=1)
+
+
+def _score_task(values):
+    return _worker_scorer.score_values(values)
@@ -0,0 +1,173 @@
+'''Multivariate outliers by Mahalanobis distance, fitted and scored in chunks.
+
+Outliers.py looks for multivariate outliers by eye in an Age vs Salary
+scatter plot, or fits an IsolationForest. For roughly elliptical data the
+squared Mahalanobis distance d2 = (x - mean)' inv(cov) (x - mean) does the
+same job far more cheaply: under normality it follows a chi-square
+distribution with one degree of freedom per column, so a row is an outlier
+when d2 exceeds chi2.ppf(1 - alpha, p).
+
+- The mean and covariance are accumulated in one chunked pass: each chunk
+  contributes its own mean and co-moment matrix (one p x p GEMM), merged
+  with Chan's update, so memory is O(p^2) whatever the row count.
+- robust=True fits a Minimum Covariance Determinant estimate (sklearn
+  MinCovDet) on a bounded reservoir sample instead, so the outliers being
+  searched for do not inflate the covariance.
+- Scoring whitens blocks of rows with one matrix product against the
+  inverse Cholesky factor, d2 = rowwise ||(X - mean) @ inv(L).T||^2, which
+  runs in BLAS for any number of columns.
+
+Rows with a missing value in any column get a NaN distance and are never
+flagged.
+
+Example:
+
+    detector = MahalanobisDetector(['Age', 'Salary'], alpha=0.001).fit('feed.csv')
+    for chunk in filter_mahalanobis('feed.csv', detector, keep='inliers'):
+        ...
+'''
+
+import numpy as np
+from scipy.linalg import cholesky, solve_triangular
+from scipy.stats import chi2
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, iter_source
+
+BLOCK_ROWS = 65_536
+
+
+class RunningCovariance:
+    '''Count, mean and co-moment matrix over complete rows, mergeable across chunks.'''
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.comoment = np.zeros((width, width))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values).any(axis=1)]
+        if len(values):
+            mean = values.mean(axis=0)
+            centred = values - mean
+            self._combine(len(values), mean, centred.T @ centred)
+        return self
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError('Cannot merge covariances over different columns')
+        self._combine(other.count, other.mean, other.comoment)
+        return self
+
+    def _combine(self, count, mean, comoment):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.comoment += comoment + np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+
+    def covariance(self, ddof=1):
+        if self.count <= ddof:
+            raise ValueError('Not enough complete rows to estimate a covariance')
+        return self.comoment / (self.count - ddof)
+
+
+def _whitener(covariance, ridge):
+    '''inv(L).T for the Cholesky factor L of covariance (ridge-regularised if singular).'''
+    width = covariance.shape[0]
+    jitter = 0.0
+    for _ in range(8):
+        try:
+            lower = cholesky(covariance + jitter * np.eye(width), lower=True)
+            break
+        except np.linalg.LinAlgError:
+            jitter = max(jitter * 10, ridge * np.trace(covariance) / width or ridge)
+    else:
+        raise np.linalg.LinAlgError('Covariance is not positive definite, even with a ridge')
+    return solve_triangular(lower, np.eye(width), lower=True).T
+
+
+class MahalanobisDetector:
+    '''Flag rows whose squared Mahalanobis distance exceeds a chi-square quantile.
+
+    alpha is the false positive rate expected under multivariate normality.
+    robust=True uses MinCovDet on a sample of sample_size rows. dtype=np.float32
+    halves the scoring memory and speeds up the BLAS products.
+    '''
+
+    def __init__(self, columns, alpha=0.001, robust=False, sample_size=100_000, ridge=1e-9,
+                 random_state=None, dtype=np.float64, block_rows=BLOCK_ROWS):
+        self.columns = list(columns)
+        self.alpha = alpha
+        self.robust = robust
+        self.sample_size = sample_size
+        self.ridge = ridge
+        self.random_state = random_state
+        self.dtype = dtype
+        self.block_rows = block_rows
+        self.location = None
+        self.covariance = None
+        self._whiten = None
+
+    @property
+    def fitted(self):
+        return self.location is not None
+
+    @property
+    def threshold(self):
+        return chi2.ppf(1 - self.alpha, len(self.columns))
+
+    def set_params(self, location, covariance):
+        self.location = np.asarray(location, dtype=np.float64)
+        self.covariance = np.asarray(covariance, dtype=np.float64)
+        self._whiten = _whitener(self.covariance, self.ridge)
+        return self
+
+    def fit(self, source, chunksize=DEFAULT_CHUNKSIZE):
+        if self.robust:
+            from sklearn.covariance import MinCovDet
+
+            from IsolationForest_Scoring import reservoir_sample
+
+            sample = reservoir_sample(source, self.columns, self.sample_size,
+                                      self.random_state, chunksize)
+            sample = sample[~np.isnan(sample).any(axis=1)]
+            mcd = MinCovDet(random_state=self.random_state).fit(sample)
+            return self.set_params(mcd.location_, mcd.covariance_)
+        moments = RunningCovariance(self.columns)
+        for chunk in iter_source(source, columns=self.columns, chunksize=chunksize):
+            moments.update(chunk[self.columns].to_numpy(dtype=np.float64))
+        return self.set_params(moments.mean, moments.covariance())
+
+    def distances(self, values):
+        '''Squared Mahalanobis distance of each row of a 2-D array.'''
+        values = np.asarray(values)
+        location = self.location.astype(self.dtype)
+        whiten = self._whiten.astype(self.dtype)
+        result = np.empty(len(values), dtype=self.dtype)
+        for start in range(0, len(values), self.block_rows):
+            block = values[start:start + self.block_rows].astype(self.dtype, copy=False) - location
+            projected = block @ whiten
+            np.einsum('ij,ij->i', projected, projected, out=result[start:start + self.block_rows])
+        return result
+
+    def score(self, frame):
+        return self.distances(frame[self.columns].to_numpy(dtype=self.dtype))
+
+    def mask(self, frame):
+        # True for outlier rows; NaN distances compare False
+        with np.errstate(invalid='ignore'):
+            return self.score(frame) > self.threshold
+
+
+def filter_mahalanobis(source, detector, keep='outliers', chunksize=DEFAULT_CHUNKSIZE):
+    '''Yield only the outlier rows (keep='outliers') or only the inliers.'''
+    if keep not in ('outliers', 'inliers'):
+        raise ValueError(f"keep must be 'outliers' or 'inliers', not {keep!r}")
+    for chunk in iter_source(source, chunksize=chunksize):
+        mask = detector.mask(chunk)
+        yield chunk[mask if keep == 'outliers' else ~mask]
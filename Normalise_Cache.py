@@ -0,0 +1,159 @@
+'''Persistent memo table for string normalisation.
+
+Categorical_Field.py and Change_Misleading.py run .str.lower().str.strip()
+and replace chains over every column on every run, although the same raw
+spellings keep coming back across columns, files and days. NormaliseCache
+remembers raw -> normalised strings:
+
+- each column is reduced to its distinct values (Category_Recode.encode),
+  only those are looked up, and the result is broadcast back through the
+  integer codes, so work scales with distinct strings, not rows;
+- only strings never seen before go through the pandas .str chain;
+- the table is bounded (least recently used entries are evicted), shared by
+  every column it is applied to and saved to an .npz file between runs;
+- hits, misses and evictions are counted, for this run and in total.
+
+A cache is tied to its normalisation options; a saved table written with
+different options is ignored.
+
+Example:
+
+    with NormaliseCache('labels_cache.npz', replace={'-': ' '}) as cache:
+        df = cache.normalise_frame(df, ['Category', 'Status'])
+        df['Status'] = recode(df['Status'], {'single': 'Not Married'}, normalise=cache)
+    print(cache.stats())
+'''
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from Category_Recode import _rebuild, encode
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+class NormaliseCache:
+    '''Bounded LRU table of raw -> normalised strings, optionally persisted.
+
+    Normalisation is lower-casing, stripping, collapsing repeated whitespace
+    and then the literal substring replacements in replace, each optional.
+    Non-string values pass through unchanged and are not cached.
+    '''
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, lower=True, strip=True,
+                 collapse_spaces=False, replace=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.options = {'lower': lower, 'strip': strip, 'collapse_spaces': collapse_spaces,
+                        'replace': list((replace or {}).items())}
+        self._table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lifetime = {'hits': 0, 'misses': 0}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def _normalise(self, text):
+        # The .str chain, run over strings that are not in the table yet
+        text = pd.Series(text, dtype=object)
+        if self.options['lower']:
+            text = text.str.lower()
+        if self.options['strip']:
+            text = text.str.strip()
+        if self.options['collapse_spaces']:
+            text = text.str.replace(r'\s+', ' ', regex=True)
+        for old, new in self.options['replace']:
+            text = text.str.replace(old, new, regex=False)
+        return text.to_numpy(dtype=object)
+
+    def __call__(self, values):
+        '''Normalised copy of an array of (distinct) values.'''
+        values = np.asarray(values, dtype=object)
+        result = values.copy()
+        table = self._table
+        missed = []
+        looked_up = 0
+        for position, value in enumerate(values):
+            if not isinstance(value, str):
+                continue
+            looked_up += 1
+            normalised = table.get(value)
+            if normalised is None:
+                missed.append(position)
+            else:
+                table.move_to_end(value)
+                result[position] = normalised
+        # Only strings are looked up, so only they count as hits or misses
+        self.hits += looked_up - len(missed)
+        self.misses += len(missed)
+        if missed:
+            raw = values[missed]
+            normalised = self._normalise(raw)
+            result[missed] = normalised
+            table.update(zip(raw.tolist(), normalised.tolist()))
+            self._evict()
+        return result
+
+    def _evict(self):
+        overflow = len(self._table) - self.max_entries
+        for _ in range(max(overflow, 0)):
+            self._table.popitem(last=False)
+        self.evictions += max(overflow, 0)
+
+    def normalise(self, series, as_category=True):
+        # Look up the distinct values only, then gather through the codes
+        codes, categories = encode(series)
+        values = self(categories.to_numpy(dtype=object))
+        return _rebuild(series, codes, values, as_category)
+
+    def normalise_frame(self, frame, columns, as_category=True):
+        frame = frame.copy(deep=False)
+        for column in columns:
+            frame[column] = self.normalise(frame[column], as_category)
+        return frame
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self._table), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'lifetime_hits': self._lifetime['hits'] + self.hits,
+                'lifetime_misses': self._lifetime['misses'] + self.misses}
+
+    def save(self, path=None):
+        '''Write the table (in LRU order) atomically; new entries count as most recent.'''
+        path = path or self.path
+        stats = self.stats()
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, raw=np.array(list(self._table), dtype=str),
+                            normalised=np.array(list(self._table.values()), dtype=str),
+                            options=np.array(json.dumps(self.options, sort_keys=True)),
+                            lifetime=np.array([stats['lifetime_hits'], stats['lifetime_misses']]))
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, path):
+        with np.load(path, allow_pickle=False) as stored:
+            if str(stored['options']) != json.dumps(self.options, sort_keys=True):
+                return self
+            self._table.update(zip(stored['raw'].tolist(), stored['normalised'].tolist()))
+            hits, misses = stored['lifetime'].tolist()
+            self._lifetime = {'hits': hits, 'misses': misses}
+        self._evict()
+        self.evictions = 0
+        return self
+
+    def __len__(self):
+        return len(self._table)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.path:
+            self.save()
@@ -0,0 +1,208 @@
+'''Multi-core fit and transform for standard, min-max and robust scaling.
+
+The StandardScaler and MinMaxScaler examples in Standardise_Numeric.py fit
+every column serially on one core. Here the numeric block is copied once into
+shared memory and split into (row partition x column shard) tasks across a
+process pool. Workers write their partial moments (count, mean, M2, min, max)
+straight into a shared result buffer, so nothing but task coordinates is
+pickled, and the parent merges the row partitions with Chan's update.
+
+Robust scaling needs exact quantiles, which do not merge across row
+partitions, so it is split by column shard only.
+
+Example:
+
+    params = parallel_fit(df, ['Age', 'Salary'], method='standard', workers=32)
+    df[['Age', 'Salary']] = parallel_transform(df, params, workers=32)
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Streaming_Standardise import RunningMoments
+
+# Rows of the shared partial-moment buffer written by each fit task
+COUNT, MEAN, M2, MIN, MAX = range(5)
+
+
+class ScalingParams:
+    '''Fitted centre and scale per column; transform is (x - center) / scale.'''
+
+    def __init__(self, columns, center, scale, method):
+        self.columns = list(columns)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.method = method
+
+    def transform(self, values):
+        return (np.asarray(values, dtype=np.float64) - self.center) / self.scale
+
+
+def _split(length, parts):
+    # Contiguous [start, stop) ranges covering 0..length in roughly equal parts
+    bounds = np.linspace(0, length, max(1, min(parts, length)) + 1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _to_shared(values):
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    view = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+    view[...] = values
+    return shm
+
+
+def _view(shm, shape):
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _attach(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _view(shm, shape)
+
+
+def _moments_task(data_name, data_shape, out_name, out_shape, part, rows, cols):
+    data_shm, data = _attach(data_name, data_shape)
+    out_shm, out = _attach(out_name, out_shape)
+    try:
+        block = data[rows[0]:rows[1], cols[0]:cols[1]]
+        valid = ~np.isnan(block)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, np.where(valid, block, 0.0).sum(axis=0) / count, 0.0)
+        deviations = np.where(valid, block - mean, 0.0)
+        target = out[part, :, cols[0]:cols[1]]
+        target[COUNT] = count
+        target[MEAN] = mean
+        target[M2] = (deviations * deviations).sum(axis=0)
+        target[MIN] = np.where(valid, block, np.inf).min(axis=0)
+        target[MAX] = np.where(valid, block, -np.inf).max(axis=0)
+    finally:
+        del data, out
+        data_shm.close()
+        out_shm.close()
+
+
+def _quantile_task(data_name, data_shape, out_name, out_shape, cols, quantile_range):
+    data_shm, data = _attach(data_name, data_shape)
+    out_shm, out = _attach(out_name, out_shape)
+    try:
+        block = data[:, cols[0]:cols[1]]
+        q = [quantile_range[0] / 100, 0.5, quantile_range[1] / 100]
+        out[:, cols[0]:cols[1]] = np.nanquantile(block, q, axis=0)
+    finally:
+        del data, out
+        data_shm.close()
+        out_shm.close()
+
+
+def _transform_task(data_name, shape, center, scale, rows):
+    data_shm, data = _attach(data_name, shape)
+    try:
+        data[rows[0]:rows[1]] -= center
+        data[rows[0]:rows[1]] /= scale
+    finally:
+        del data
+        data_shm.close()
+
+
+def _numeric_block(frame, columns):
+    if columns is None:
+        return np.ascontiguousarray(frame, dtype=np.float64), None
+    return np.ascontiguousarray(frame[columns].to_numpy(dtype=np.float64)), list(columns)
+
+
+def parallel_fit(frame, columns=None, method='standard', workers=None,
+                 row_parts=None, col_shards=None, feature_range=(0, 1),
+                 quantile_range=(25.0, 75.0)):
+    '''Fit standard, minmax or robust scaling parameters across a process pool.
+
+    frame may be a DataFrame (with columns) or a 2-D array (columns=None).
+    '''
+    if method not in ('standard', 'minmax', 'robust'):
+        raise ValueError(f'Unknown scaling method: {method!r}')
+    values, columns = _numeric_block(frame, columns)
+    if columns is None:
+        columns = list(range(values.shape[1]))
+    workers = workers or os.cpu_count() or 1
+    n_rows, n_cols = values.shape
+    col_ranges = _split(n_cols, col_shards or min(workers, n_cols))
+
+    data_shm = _to_shared(values)
+    del values
+    try:
+        if method == 'robust':
+            out_shape = (3, n_cols)
+            out_shm = _to_shared(np.zeros(out_shape))
+            try:
+                with ProcessPoolExecutor(workers) as pool:
+                    tasks = [pool.submit(_quantile_task, data_shm.name, (n_rows, n_cols),
+                                         out_shm.name, out_shape, cols, quantile_range)
+                             for cols in col_ranges]
+                    for task in tasks:
+                        task.result()
+                low, median, high = _view(out_shm, out_shape).copy()
+            finally:
+                out_shm.close()
+                out_shm.unlink()
+            iqr = high - low
+            return ScalingParams(columns, median, np.where(iqr == 0, 1.0, iqr), method)
+
+        row_ranges = _split(n_rows, row_parts or max(1, workers // len(col_ranges)))
+        out_shape = (len(row_ranges), 5, n_cols)
+        out_shm = _to_shared(np.zeros(out_shape))
+        try:
+            with ProcessPoolExecutor(workers) as pool:
+                tasks = [pool.submit(_moments_task, data_shm.name, (n_rows, n_cols),
+                                     out_shm.name, out_shape, part, rows, cols)
+                         for part, rows in enumerate(row_ranges) for cols in col_ranges]
+                for task in tasks:
+                    task.result()
+            partials = _view(out_shm, out_shape).copy()
+        finally:
+            out_shm.close()
+            out_shm.unlink()
+    finally:
+        data_shm.close()
+        data_shm.unlink()
+
+    if method == 'minmax':
+        data_min = partials[:, MIN].min(axis=0)
+        data_range = partials[:, MAX].max(axis=0) - data_min
+        data_range = np.where(data_range == 0, 1.0, data_range)
+        low, high = feature_range
+        # (x - min) / range * (high - low) + low  ==  (x - center) / scale
+        scale = data_range / (high - low)
+        return ScalingParams(columns, data_min - low * scale, scale, method)
+
+    moments = RunningMoments(columns)
+    for partial in partials:
+        part = RunningMoments(columns)
+        part.count = partial[COUNT].astype(np.int64)
+        part.mean = partial[MEAN]
+        part.m2 = partial[M2]
+        moments.merge(part)
+    return ScalingParams(columns, moments.mean, moments.scale(), method)
+
+
+def parallel_transform(frame, params, workers=None):
+    # Apply fitted params in place on a shared buffer split by row partition
+    values, _ = _numeric_block(frame, params.columns if hasattr(frame, 'columns') else None)
+    workers = workers or os.cpu_count() or 1
+    shm = _to_shared(values)
+    shape = values.shape
+    del values
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            tasks = [pool.submit(_transform_task, shm.name, shape, params.center,
+                                 params.scale, rows)
+                     for rows in _split(shape[0], workers)]
+            for task in tasks:
+                task.result()
+        result = _view(shm, shape).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return result
@@ -0,0 +1,158 @@
+'''Overlap chunk reading and writing with the CPU work on each chunk.
+
+The recipes run read -> transform -> write strictly in turn, so the CPU waits
+while a chunk is parsed or written and the disk waits while it is scaled or
+recoded. Here a background thread reads ahead into a bounded queue
+(prefetch) and another writes finished chunks from a bounded queue
+(AsyncWriter). When the writer falls behind its queue fills and write()
+blocks (backpressure), so at most read_depth + write_depth chunks are held
+in memory besides the ones being transformed. CSV parsing, Arrow decoding,
+file writes and most NumPy kernels release the GIL, so plain threads are
+enough to keep the disk and the CPU busy together. Errors raised in either
+thread are re-raised in the caller.
+
+standardise_file(..., prefetch=2) and Pipeline.run(..., prefetch=2) use this;
+transform_file() runs any chunk function the same way.
+
+Example:
+
+    transform_file('feed.csv', 'feed_std.parquet',
+                   lambda chunk: standardise_chunk(chunk, moments), prefetch=3)
+'''
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, ChunkWriter, iter_source
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(chunks, depth=2):
+    '''Iterate over chunks while a background thread reads up to depth ahead.'''
+    if depth <= 0:
+        yield from chunks
+        return
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def _put(item):
+        # Give up if the consumer has gone away instead of blocking forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read():
+        try:
+            for chunk in chunks:
+                if not _put(chunk):
+                    return
+            _put(_DONE)
+        except BaseException as error:
+            _put(_Failure(error))
+
+    reader = threading.Thread(target=_read, name='prep-prefetch', daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+class AsyncWriter:
+    '''Write chunks from a background thread through a bounded queue.
+
+    writer is a path (wrapped in a ChunkWriter) or any object with
+    write(chunk) and close(). write() blocks while depth chunks are waiting.
+    '''
+
+    def __init__(self, writer, depth=2):
+        self.writer = ChunkWriter(writer) if isinstance(writer, (str, os.PathLike)) else writer
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, name='prep-writer', daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _DONE:
+                return
+            if self._error is None:
+                try:
+                    self.writer.write(chunk)
+                except BaseException as error:
+                    # Keep draining so producers never block on a dead writer
+                    self._error = error
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, chunk):
+        self._raise()
+        self._queue.put(chunk)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        self.writer.close()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _ordered_map(transform, chunks, workers, depth):
+    # transform chunks in a thread pool, yielding results in input order
+    with ThreadPoolExecutor(workers, thread_name_prefix='prep-transform') as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(transform, chunk))
+            if len(pending) > workers + depth:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def transform_file(src, dst, transform, chunksize=DEFAULT_CHUNKSIZE, prefetch_depth=2,
+                   write_depth=2, workers=1):
+    '''Read src, apply transform to each chunk and write dst, overlapping the three.
+
+    src can be anything iter_source accepts. With workers > 1 several chunks
+    are transformed at once in threads (output order is kept).
+    '''
+    if os.path.exists(dst):
+        os.remove(dst)
+    chunks = prefetch(iter_source(src, chunksize=chunksize), prefetch_depth)
+    if workers > 1:
+        results = _ordered_map(transform, chunks, workers, prefetch_depth)
+    else:
+        results = map(transform, chunks)
+    with AsyncWriter(dst, write_depth) as writer:
+        for chunk in results:
+            writer.write(chunk)
+    return dst
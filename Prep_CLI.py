@@ -0,0 +1,278 @@
+'''Command-line entry point for the preparation steps.
+
+Each recipe script imports pandas, scipy, sklearn, matplotlib and seaborn at
+the top, so a batch task that runs one step pays seconds of imports before
+touching any data. This module only imports the standard library up front;
+a step imports what it needs when it runs (pandas and the Pipeline for every
+step, scipy only for Mahalanobis outliers, matplotlib only with --plot).
+
+Every step streams SRC to DST chunk by chunk through Prep_Pipeline (CSV,
+Parquet or Feather by extension) and prints a one-line JSON summary.
+
+    python Prep_CLI.py index feed.csv out.csv --column Index --start 1
+    python Prep_CLI.py recode feed.csv out.csv --column Status --normalise \\
+        --mapping '{"single": "Not Married"}'
+    python Prep_CLI.py correct feed.csv out.csv --rules rules.json
+    python Prep_CLI.py outliers feed.csv out.csv --columns Age Salary --method iqr \\
+        --plot outliers.png
+    python Prep_CLI.py standardise feed.csv out.parquet --columns Age Salary
+
+worker mode keeps one interpreter (and its imports) alive for many jobs: it
+reads one job per line from stdin (or --jobs FILE), either a JSON list of
+arguments as above or {"argv": [...]}, and answers each with one JSON line.
+A failing job reports its error and the worker carries on; --help and
+usage errors come back inside the JSON reply.
+
+    printf '%s\\n' '["standardise", "a.csv", "a_std.csv", "--columns", "Age"]' \\
+        | python Prep_CLI.py worker
+'''
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+
+PLOT_ROWS = 50_000
+PLOT_UNAVAILABLE = '--plot needs matplotlib, which is not installed'
+
+
+def _json_argument(value):
+    # Inline JSON, or @path to read it from a file
+    if value.startswith('@'):
+        with open(value[1:]) as handle:
+            return json.load(handle)
+    return json.loads(value)
+
+
+def _pipeline():
+    from Prep_Pipeline import Pipeline
+
+    return Pipeline()
+
+
+def _run(pipeline, args, each=None):
+    '''Stream src through the pipeline into dst; each(chunk) may filter chunks.'''
+    from Prefetch_IO import AsyncWriter
+    from Streaming_Standardise import ChunkWriter
+
+    if os.path.exists(args.dst):
+        os.remove(args.dst)
+    rows = 0
+    writer = AsyncWriter(args.dst, args.prefetch) if args.prefetch else ChunkWriter(args.dst)
+    with writer:
+        for chunk in pipeline.iter_run(args.src, args.chunksize, args.prefetch):
+            if each is not None:
+                chunk = each(chunk)
+            writer.write(chunk)
+            rows += len(chunk)
+    return {'dst': args.dst, 'rows': rows}
+
+
+def run_index(args):
+    return _run(_pipeline().index(args.column, args.start), args)
+
+
+def run_recode(args):
+    mapping = _json_argument(args.mapping) if args.mapping else None
+    pipeline = _pipeline().recode(args.column, mapping, args.normalise, args.unmapped)
+    return _run(pipeline, args)
+
+
+def run_correct(args):
+    from Correction_Rules import rules_from_spec
+
+    with open(args.rules) as handle:
+        rules = rules_from_spec(json.load(handle))
+    pipeline = _pipeline().correct(rules)
+    summary = _run(pipeline, args)
+    summary['rows_changed'] = pipeline.stages[0].report
+    return summary
+
+
+def _plot_unavailable(args):
+    return bool(getattr(args, 'plot', None)) and importlib.util.find_spec('matplotlib') is None
+
+
+def run_outliers(args):
+    options = {'flag_column': args.flag_column}
+    if args.method == 'iqr':
+        options['whisker'] = args.whisker
+    elif args.method == 'zscore':
+        options['threshold'] = args.threshold
+    elif args.method == 'mahalanobis':
+        options['alpha'] = args.alpha
+    if not args.plot:
+        return _run(_pipeline().outliers(args.columns, args.method, **options), args)
+
+    # Fail before reading any data rather than after writing the output
+    if _plot_unavailable(args):
+        raise ValueError(PLOT_UNAVAILABLE)
+
+    # Flag every row so a sample of both inliers and outliers can be plotted
+    import numpy as np
+    import pandas as pd
+
+    flag = args.flag_column or '_outlier'
+    options['flag_column'] = flag
+    rng = np.random.default_rng(0)
+    sample = {'rows': None, 'keys': np.empty(0)}
+    counts = {'outliers': 0}
+
+    def each(chunk):
+        # Reservoir sample over the whole file: keep the PLOT_ROWS smallest random keys
+        rows = chunk[args.columns + [flag]]
+        keys = np.concatenate([sample['keys'], rng.random(len(rows))])
+        if sample['rows'] is not None:
+            rows = pd.concat([sample['rows'], rows])
+        if len(keys) > PLOT_ROWS:
+            keep = np.sort(np.argpartition(keys, PLOT_ROWS)[:PLOT_ROWS])
+            rows, keys = rows.iloc[keep], keys[keep]
+        sample['rows'], sample['keys'] = rows, keys
+        counts['outliers'] += int(chunk[flag].sum())
+        if args.flag_column:
+            return chunk
+        return chunk[~chunk[flag]].drop(columns=flag)
+
+    summary = _run(_pipeline().outliers(args.columns, args.method, **options), args, each)
+    if sample['rows'] is not None:
+        plot_outliers(sample['rows'], args.columns, flag, args.plot)
+    return dict(summary, outliers=counts['outliers'], plot=args.plot)
+
+
+def plot_outliers(sample, columns, flag, path):
+    '''Scatter of the first two columns (or a strip of one), outliers in red.'''
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    colours = sample[flag].map({True: 'red', False: 'blue'})
+    fig, ax = plt.subplots(figsize=(8, 6))
+    if len(columns) > 1:
+        ax.scatter(sample[columns[0]], sample[columns[1]], c=colours, s=4)
+        ax.set_xlabel(columns[0])
+        ax.set_ylabel(columns[1])
+    else:
+        ax.scatter(sample[columns[0]], range(len(sample)), c=colours, s=4)
+        ax.set_xlabel(columns[0])
+    ax.set_title('Outliers (red)')
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def run_standardise(args):
+    options = {'ddof': args.ddof}
+    if args.float32:
+        import numpy as np
+
+        options['dtype'] = np.float32
+    return _run(_pipeline().standardise(args.columns, args.method, **options), args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='Prep_CLI.py', description='Data preparation steps')
+    steps = parser.add_subparsers(dest='step', required=True)
+
+    def step(name, handler, help):
+        sub = steps.add_parser(name, help=help)
+        sub.add_argument('src')
+        sub.add_argument('dst')
+        sub.add_argument('--chunksize', type=int, default=100_000)
+        sub.add_argument('--prefetch', type=int, default=0,
+                         help='chunks to read ahead in a background thread')
+        sub.set_defaults(handler=handler)
+        return sub
+
+    sub = step('index', run_index, 'add a running row number')
+    sub.add_argument('--column', default='Index')
+    sub.add_argument('--start', type=int, default=1)
+
+    sub = step('recode', run_recode, 'normalise and re-map categorical labels')
+    sub.add_argument('--column', required=True)
+    sub.add_argument('--mapping', help='JSON object, or @file.json')
+    sub.add_argument('--normalise', action='store_true', help='lower-case and strip labels')
+    sub.add_argument('--unmapped', choices=('keep', 'nan'), default='keep')
+
+    sub = step('correct', run_correct, 'apply correction rules')
+    sub.add_argument('--rules', required=True,
+                     help='JSON list of {name, column, value, when} rules')
+
+    sub = step('outliers', run_outliers, 'drop or flag outlier rows')
+    sub.add_argument('--columns', nargs='+', required=True)
+    sub.add_argument('--method', choices=('iqr', 'percentile', 'zscore', 'mahalanobis'),
+                     default='iqr')
+    sub.add_argument('--flag-column', help='flag outliers in this column instead of dropping')
+    sub.add_argument('--whisker', type=float, default=1.5)
+    sub.add_argument('--threshold', type=float, default=3.0)
+    sub.add_argument('--alpha', type=float, default=0.001)
+    sub.add_argument('--plot', help='save a scatter plot of a sample to this image file')
+
+    sub = step('standardise', run_standardise, 'z-score or min-max scale columns')
+    sub.add_argument('--columns', nargs='+', required=True)
+    sub.add_argument('--method', choices=('standard', 'minmax'), default='standard')
+    sub.add_argument('--ddof', type=int, default=0)
+    sub.add_argument('--float32', action='store_true')
+
+    worker = steps.add_parser('worker', help='run many jobs in one process')
+    worker.add_argument('--jobs', help='file with one job per line (default: stdin)')
+    worker.set_defaults(handler=None)
+    return parser
+
+
+def run_job(parser, argv):
+    '''Run one step; return its JSON-able summary or raise.'''
+    # argparse prints help and usage errors itself; keep them off the JSON reply stream
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            args = parser.parse_args(argv)
+    except SystemExit as error:
+        if not error.code:
+            return {'help': output.getvalue()}
+        message = output.getvalue().strip().splitlines()
+        raise ValueError(message[-1] if message else f'Invalid arguments: {argv}') from None
+    if args.step == 'worker':
+        raise ValueError('Cannot start a worker from a worker job')
+    return args.handler(args)
+
+
+def serve(parser, stream, out):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        started = time.perf_counter()
+        try:
+            job = json.loads(line)
+            argv = job['argv'] if isinstance(job, dict) else job
+            reply = {'ok': True, 'result': run_job(parser, [str(arg) for arg in argv])}
+        except Exception as error:
+            reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+        reply['seconds'] = round(time.perf_counter() - started, 6)
+        out.write(json.dumps(reply, default=str) + '\n')
+        out.flush()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.step == 'worker':
+        if args.jobs:
+            with open(args.jobs) as stream:
+                serve(parser, stream, sys.stdout)
+        else:
+            serve(parser, sys.stdin, sys.stdout)
+        return 0
+    if _plot_unavailable(args):
+        # A usage error, not a traceback; worker jobs report it as JSON instead
+        parser.error(PLOT_UNAVAILABLE)
+    print(json.dumps(args.handler(args), default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
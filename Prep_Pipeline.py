@@ -0,0 +1,481 @@
+'''Lazy, fused data-preparation pipeline.
+
+Add_an_Index.py, Categorical_Field.py, Change_Misleading.py, Outliers.py and
+Standardise_Numeric.py each build and copy a full DataFrame. A Pipeline
+instead records the steps as lazy stages and runs them together over each
+chunk: a chunk is copied once, every stage updates it in turn, and it is
+written or yielded before the next chunk is read.
+
+Stages that need statistics (outlier fences, scaling parameters) are fitted
+in as few scans as possible: all unfitted stages that do not depend on each
+other share one scan, and a stage only waits for a later scan when an
+unfitted stage upstream drops rows or rewrites a column it reads. Passing
+already fitted statistics (e.g. from Fit_Cache or Incremental_Fit) removes
+those scans. explain() shows the plan before anything is read.
+
+Every stage reports to Instrumentation, so an active recording (or
+PREP_TRACE=trace.json) shows rows, time and memory per stage.
+
+Example:
+
+    pipe = (Pipeline()
+            .recode('Status', {'single': 'Not Married'}, normalise=True)
+            .correct(rules)
+            .outliers(['Age'], method='iqr')
+            .standardise(['Age', 'Salary'])
+            .index('Index'))
+    print(pipe.explain())
+    pipe.run('feed.csv', 'prepared.parquet')
+'''
+
+import os
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+from Category_Recode import recode
+from Impute_Missing import Imputer
+from Instrumentation import enable_from_env, span
+from Prefetch_IO import AsyncWriter
+from Prefetch_IO import prefetch as read_ahead
+from Quantile_Sketch import QuantileSketch
+from Streaming_Outliers import Fences, iqr_fences, percentile_fences
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, ChunkWriter, RunningMoments, iter_source
+
+
+class Stage:
+    '''One lazy step; subclasses set reads/writes and implement apply.'''
+
+    name = 'stage'
+    drops_rows = False
+
+    def __init__(self, reads=(), writes=()):
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    @property
+    def fitted(self):
+        return True
+
+    def start_fit(self):
+        pass
+
+    def partial_fit(self, chunk):
+        pass
+
+    def finish_fit(self):
+        pass
+
+    def reset(self):
+        # Called before each run, for stages with per-run state
+        pass
+
+    def apply(self, chunk):
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+
+class IndexStage(Stage):
+    '''Add a running row number (df.index + start) that continues across chunks.'''
+
+    name = 'index'
+
+    def __init__(self, column='Index', start=1):
+        super().__init__(writes=[column])
+        self.column = column
+        self.start = start
+        self._offset = 0
+
+    def reset(self):
+        self._offset = 0
+
+    def apply(self, chunk):
+        chunk[self.column] = np.arange(self._offset, self._offset + len(chunk)) + self.start
+        self._offset += len(chunk)
+        return chunk
+
+    def describe(self):
+        return f'index {self.column!r} from {self.start}'
+
+
+class RecodeStage(Stage):
+    name = 'recode'
+
+    def __init__(self, column, mapping=None, normalise=False, unmapped='keep'):
+        super().__init__(reads=[column], writes=[column])
+        self.column = column
+        self.mapping = mapping
+        self.normalise = normalise
+        self.unmapped = unmapped
+
+    def apply(self, chunk):
+        chunk[self.column] = recode(chunk[self.column], self.mapping, self.normalise,
+                                    self.unmapped, as_category=False)
+        return chunk
+
+    def describe(self):
+        return f'recode {self.column!r}' + (' (normalised)' if self.normalise else '')
+
+
+class CorrectStage(Stage):
+    name = 'correct'
+
+    def __init__(self, rules):
+        reads = set().union(*(rule.columns() for rule in rules.rules)) if rules.rules else set()
+        super().__init__(reads=reads, writes=[rule.column for rule in rules.rules])
+        self.rules = rules
+        self.report = {}
+
+    def reset(self):
+        self.report = {rule.name: 0 for rule in self.rules.rules}
+
+    def apply(self, chunk):
+        chunk, report = self.rules.apply(chunk, inplace=True)
+        for name, count in report.items():
+            self.report[name] = self.report.get(name, 0) + int(count)
+        return chunk
+
+    def describe(self):
+        return f'correct ({len(self.rules.rules)} rules -> {sorted(self.writes)})'
+
+
+class ImputeStage(Stage):
+    '''Fill missing values from mean/median/mode (optionally per group) or constants.'''
+
+    name = 'impute'
+
+    def __init__(self, strategies, by=None, k=200, imputer=None):
+        self.imputer = imputer or Imputer(strategies, by, k)
+        group = [] if by is None else [by] if isinstance(by, str) else list(by)
+        super().__init__(reads=list(self.imputer.strategies) + group,
+                         writes=list(self.imputer.strategies))
+
+    @property
+    def fitted(self):
+        return self.imputer.fitted
+
+    def start_fit(self):
+        self.imputer.start_fit()
+
+    def partial_fit(self, chunk):
+        self.imputer.partial_fit(chunk)
+
+    def finish_fit(self):
+        self.imputer.finish_fit()
+
+    def apply(self, chunk):
+        return self.imputer.transform(chunk, inplace=True)
+
+    def describe(self):
+        by = f' by {self.imputer.by!r}' if self.imputer.by is not None else ''
+        return f'impute {self.imputer.strategies}{by}'
+
+
+class OutlierStage(Stage):
+    '''Filter (or flag) rows outside IQR, percentile or z-score fences.'''
+
+    name = 'outliers'
+
+    def __init__(self, columns, method='iqr', flag_column=None, whisker=1.5,
+                 percentiles=(0.01, 0.99), threshold=3.0, k=200, fences=None):
+        if method not in ('iqr', 'percentile', 'zscore'):
+            raise ValueError(f'Unknown outlier method: {method!r}')
+        super().__init__(reads=columns, writes=[flag_column] if flag_column else [])
+        self.columns = list(columns)
+        self.method = method
+        self.flag_column = flag_column
+        self.drops_rows = flag_column is None
+        self.whisker = whisker
+        self.percentiles = percentiles
+        self.threshold = threshold
+        self.k = k
+        self.fences = fences
+        self._state = None
+
+    @property
+    def fitted(self):
+        return self.fences is not None
+
+    def start_fit(self):
+        if self.method == 'zscore':
+            self._state = RunningMoments(self.columns)
+        else:
+            self._state = {column: QuantileSketch(self.k) for column in self.columns}
+
+    def partial_fit(self, chunk):
+        if self.method == 'zscore':
+            self._state.update(chunk[self.columns].to_numpy(dtype=np.float64))
+        else:
+            for column in self.columns:
+                self._state[column].update(chunk[column].to_numpy(dtype=np.float64))
+
+    def finish_fit(self):
+        if self.method == 'iqr':
+            self.fences = iqr_fences(self._state, self.whisker)
+        elif self.method == 'percentile':
+            self.fences = percentile_fences(self._state, *self.percentiles)
+        else:
+            mean, std = self._state.mean, self._state.std()
+            self.fences = {column: Fences(column, mean[i] - self.threshold * std[i],
+                                          mean[i] + self.threshold * std[i])
+                           for i, column in enumerate(self.columns)}
+        self._state = None
+
+    def apply(self, chunk):
+        mask = np.zeros(len(chunk), dtype=bool)
+        for column, fence in self.fences.items():
+            mask |= fence.mask(chunk[column].to_numpy(dtype=np.float64))
+        if self.flag_column:
+            chunk[self.flag_column] = mask
+            return chunk
+        return chunk[~mask]
+
+    def describe(self):
+        action = f'flag into {self.flag_column!r}' if self.flag_column else 'drop rows'
+        return f'outliers {self.method} on {self.columns} ({action})'
+
+
+class MahalanobisStage(Stage):
+    '''Filter (or flag) rows by Mahalanobis distance over several columns.'''
+
+    name = 'outliers'
+    method = 'mahalanobis'
+
+    def __init__(self, columns, flag_column=None, detector=None, **options):
+        # Imported here so pipelines without this stage do not load scipy
+        from Mahalanobis_Outliers import MahalanobisDetector
+
+        super().__init__(reads=columns, writes=[flag_column] if flag_column else [])
+        self.detector = detector or MahalanobisDetector(columns, **options)
+        self.flag_column = flag_column
+        self.drops_rows = flag_column is None
+        self._state = None
+
+    @property
+    def fitted(self):
+        return self.detector.fitted
+
+    def start_fit(self):
+        if self.detector.robust:
+            raise ValueError('Fit robust Mahalanobis detectors beforehand and pass detector=')
+        from Mahalanobis_Outliers import RunningCovariance
+
+        self._state = RunningCovariance(self.detector.columns)
+
+    def partial_fit(self, chunk):
+        self._state.update(chunk[self.detector.columns].to_numpy(dtype=np.float64))
+
+    def finish_fit(self):
+        self.detector.set_params(self._state.mean, self._state.covariance())
+        self._state = None
+
+    def apply(self, chunk):
+        mask = self.detector.mask(chunk)
+        if self.flag_column:
+            chunk[self.flag_column] = mask
+            return chunk
+        return chunk[~mask]
+
+    def describe(self):
+        action = f'flag into {self.flag_column!r}' if self.flag_column else 'drop rows'
+        return f'outliers mahalanobis on {self.detector.columns} ({action})'
+
+
+class StandardiseStage(Stage):
+    '''Standard (z) or min-max scaling with statistics from a fit scan.'''
+
+    name = 'standardise'
+
+    def __init__(self, columns, method='standard', ddof=0, params=None, dtype=np.float64):
+        if method not in ('standard', 'minmax'):
+            raise ValueError(f'Unknown scaling method: {method!r}')
+        super().__init__(reads=columns, writes=columns)
+        self.columns = list(columns)
+        self.method = method
+        self.ddof = ddof
+        self.dtype = dtype
+        # (center, scale) so that transform is (x - center) / scale
+        self.params = params
+        self._state = None
+
+    @property
+    def fitted(self):
+        return self.params is not None
+
+    def start_fit(self):
+        if self.method == 'standard':
+            self._state = RunningMoments(self.columns)
+        else:
+            width = len(self.columns)
+            self._state = [np.full(width, np.inf), np.full(width, -np.inf)]
+
+    def partial_fit(self, chunk):
+        values = chunk[self.columns].to_numpy(dtype=np.float64)
+        if self.method == 'standard':
+            self._state.update(values)
+        elif len(values):
+            self._state[0] = np.fmin(self._state[0], np.nanmin(values, axis=0))
+            self._state[1] = np.fmax(self._state[1], np.nanmax(values, axis=0))
+
+    def finish_fit(self):
+        if self.method == 'standard':
+            self.params = (self._state.mean, self._state.scale(self.ddof))
+        else:
+            data_min, data_max = self._state
+            data_range = data_max - data_min
+            self.params = (data_min, np.where(data_range == 0, 1.0, data_range))
+        self._state = None
+
+    def apply(self, chunk):
+        center, scale = (np.asarray(param, dtype=self.dtype) for param in self.params)
+        chunk[self.columns] = (chunk[self.columns].to_numpy(dtype=self.dtype) - center) / scale
+        return chunk
+
+    def describe(self):
+        return f'standardise {self.method} {self.columns}'
+
+
+class Pipeline:
+    '''Chain of lazy stages executed chunk by chunk.'''
+
+    def __init__(self, stages=None):
+        self.stages = list(stages or [])
+
+    def add(self, stage):
+        self.stages.append(stage)
+        return self
+
+    def index(self, column='Index', start=1):
+        return self.add(IndexStage(column, start))
+
+    def recode(self, column, mapping=None, normalise=False, unmapped='keep'):
+        return self.add(RecodeStage(column, mapping, normalise, unmapped))
+
+    def correct(self, rules):
+        return self.add(CorrectStage(rules))
+
+    def impute(self, strategies, by=None, **options):
+        return self.add(ImputeStage(strategies, by, **options))
+
+    def outliers(self, columns, method='iqr', **options):
+        if method == 'mahalanobis':
+            return self.add(MahalanobisStage(columns, **options))
+        return self.add(OutlierStage(columns, method, **options))
+
+    def standardise(self, columns, method='standard', **options):
+        return self.add(StandardiseStage(columns, method, **options))
+
+    def fit_scans(self):
+        '''Group the unfitted stages into the scans needed to fit them.
+
+        Walking the stages in order, columns written by a stage that is still
+        unfitted (or derived from such columns) are tainted, as are all rows
+        once an unfitted stage may drop some. A stage can be fitted in the
+        current scan only if it reads nothing tainted.
+        '''
+        scans = []
+        pending = {i for i, stage in enumerate(self.stages) if not stage.fitted}
+        while pending:
+            scan, tainted, rows_tainted = [], set(), False
+            for i, stage in enumerate(self.stages):
+                blocked = rows_tainted or bool(stage.reads & tainted)
+                if i in pending and not blocked:
+                    scan.append(i)
+                if i in pending or blocked:
+                    tainted |= stage.writes
+                    rows_tainted = rows_tainted or stage.drops_rows
+            scans.append(scan)
+            pending -= set(scan)
+        return scans
+
+    def explain(self):
+        lines = ['Pipeline plan:']
+        for i, stage in enumerate(self.stages):
+            state = '' if stage.fitted else '  [needs fit]'
+            lines.append(f'  {i}: {stage.describe()}{state}')
+        scans = self.fit_scans()
+        for n, scan in enumerate(scans, 1):
+            names = ', '.join(f'{i}:{self.stages[i].name}' for i in scan)
+            lines.append(f'Scan {n}: fit {names}')
+        lines.append(f'Scan {len(scans) + 1}: apply all {len(self.stages)} stages per chunk')
+        return '\n'.join(lines)
+
+    def fit(self, source, chunksize=DEFAULT_CHUNKSIZE):
+        '''Fit the unfitted stages, in as many scans of source as fit_scans() plans.
+
+        Fitting reads source again for the apply pass, so it must be a path,
+        a DataFrame or a re-iterable collection of chunks, not an iterator.
+        '''
+        scans = self.fit_scans()
+        if scans and isinstance(source, Iterator):
+            raise TypeError('Pipeline needs a fit scan before the apply pass, so the source '
+                            'must be a path, a DataFrame or a re-iterable of chunks, not a '
+                            'one-shot iterator (generator or chunked reader); pass a path '
+                            'or fit the stages beforehand')
+        for scan in scans:
+            for i in scan:
+                self.stages[i].start_fit()
+            for stage in self.stages:
+                stage.reset()
+            last = max(scan)
+            for chunk in iter_source(source, chunksize=chunksize):
+                chunk = chunk.copy()
+                for i, stage in enumerate(self.stages[:last + 1]):
+                    if i in scan:
+                        with span(f'fit {i}:{stage.name}', len(chunk)) as fitting:
+                            stage.partial_fit(chunk)
+                            fitting.rows_out = len(chunk)
+                    elif stage.fitted:
+                        chunk = self._apply(i, stage, chunk)
+                    # Unfitted stages outside this scan cannot affect the
+                    # stages being fitted, so they are simply skipped here
+            for i in scan:
+                self.stages[i].finish_fit()
+        return self
+
+    @staticmethod
+    def _apply(i, stage, chunk):
+        with span(f'{i}:{stage.name}', len(chunk)) as applied:
+            chunk = stage.apply(chunk)
+            applied.rows_out = len(chunk)
+        return chunk
+
+    def transform_chunk(self, chunk):
+        chunk = chunk.copy()
+        for i, stage in enumerate(self.stages):
+            chunk = self._apply(i, stage, chunk)
+        return chunk
+
+    def iter_run(self, source, chunksize=DEFAULT_CHUNKSIZE, prefetch=0):
+        # Yield prepared chunks; fits any unfitted stages first
+        enable_from_env()
+        if not all(stage.fitted for stage in self.stages):
+            self.fit(source, chunksize)
+        for stage in self.stages:
+            stage.reset()
+        chunks = iter_source(source, chunksize=chunksize)
+        if prefetch:
+            chunks = read_ahead(chunks, prefetch)
+        for chunk in chunks:
+            yield self.transform_chunk(chunk)
+
+    def run(self, source, dst=None, chunksize=DEFAULT_CHUNKSIZE, prefetch=0):
+        '''Write prepared chunks to dst, or return them concatenated if dst is None.
+
+        prefetch > 0 reads the next chunks and writes finished ones in
+        background threads, up to that many chunks ahead (Prefetch_IO).
+        '''
+        if dst is None:
+            return pd.concat(list(self.iter_run(source, chunksize, prefetch)))
+        if os.path.exists(dst):
+            os.remove(dst)
+        writer = AsyncWriter(dst, prefetch) if prefetch else ChunkWriter(dst)
+        with writer:
+            for chunk in self.iter_run(source, chunksize, prefetch):
+                with span('write', len(chunk)) as written:
+                    writer.write(chunk)
+                    written.rows_out = len(chunk)
+        return dst
@@ -0,0 +1,138 @@
+'''Mergeable KLL quantile sketch with bounded memory.
+
+df['Age'].quantile(q) sorts the whole column. A KLL sketch keeps a small
+hierarchy of sorted compactors instead: level h holds items that each stand
+for 2**h original values, and when a level overflows it is sorted and every
+other item (from a random offset) is promoted to the next level. Memory is
+O(k log(n / k)) and the rank error is about rank_error() of n, independent of
+n. Sketches built on different chunks or workers merge by concatenating
+levels and compacting again.
+
+Example:
+
+    sketch = QuantileSketch(k=200)
+    for chunk in chunks:
+        sketch.update(chunk['Age'].to_numpy())
+    q1, q3 = sketch.quantile([0.25, 0.75])
+'''
+
+import math
+
+import numpy as np
+
+# Capacity decay between adjacent levels (2/3 in the KLL paper)
+_DECAY = 2 / 3
+
+
+class QuantileSketch:
+    '''KLL sketch over float values; NaN values are ignored.'''
+
+    def __init__(self, k=200, seed=None):
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._levels = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0, dtype=np.float64))
+        for h, items in enumerate(other._levels):
+            self._levels[h] = np.concatenate([self._levels[h], items])
+        self._compress()
+        return self
+
+    def _capacity(self, h):
+        depth = len(self._levels) - 1 - h
+        return max(2, int(math.ceil(self.k * _DECAY ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self._levels):
+            items = self._levels[h]
+            if items.size > self._capacity(h):
+                if h + 1 == len(self._levels):
+                    self._levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # An odd item out stays behind so total weight is preserved
+                keep = items[:1] if items.size % 2 else items[:0]
+                paired = items[keep.size:]
+                promoted = paired[self._rng.integers(2)::2]
+                self._levels[h] = keep
+                self._levels[h + 1] = np.concatenate([self._levels[h + 1], promoted])
+            h += 1
+
+    def _weighted(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(level.size, 2 ** h, dtype=np.float64)
+                                  for h, level in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        '''Approximate quantile(s) for q in [0, 1].'''
+        if self.count == 0:
+            raise ValueError('Cannot query an empty sketch')
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        items, cumulative = self._weighted()
+        targets = q * cumulative[-1]
+        idx = np.minimum(np.searchsorted(cumulative, targets, side='left'), items.size - 1)
+        result = items[idx]
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return float(result[0]) if scalar else result
+
+    def rank(self, value):
+        # Approximate fraction of values <= value
+        items, cumulative = self._weighted()
+        idx = np.searchsorted(items, value, side='right')
+        return float(cumulative[idx - 1] / cumulative[-1]) if idx else 0.0
+
+    def rank_error(self):
+        # Normalised rank error at ~99% confidence (empirical KLL fit)
+        return 2.296 / self.k ** 0.9723
+
+    def to_arrays(self):
+        # Flat arrays for saving with np.savez; see from_arrays
+        return {
+            'k': np.array(self.k),
+            'count': np.array(self.count),
+            'bounds': np.array([self.min, self.max]),
+            'level_sizes': np.array([level.size for level in self._levels]),
+            'items': np.concatenate(self._levels),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, seed=None):
+        sketch = cls(int(arrays['k']), seed=seed)
+        sketch.count = int(arrays['count'])
+        sketch.min, sketch.max = (float(bound) for bound in arrays['bounds'])
+        splits = np.cumsum(arrays['level_sizes'])[:-1]
+        sketch._levels = [level.astype(np.float64) for level in np.split(arrays['items'], splits)]
+        return sketch
+
+    def retained(self):
+        return sum(level.size for level in self._levels)
+
+    def __len__(self):
+        return self.count
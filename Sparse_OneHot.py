@@ -0,0 +1,125 @@
+'''Sparse, memory-bounded one-hot encoding for high-cardinality fields.
+
+pd.get_dummies in Categorical_Field.py materialises one dense column per
+category, so a 20k-level product or zip code field needs rows x 20k bytes.
+SparseOneHotEncoder builds scipy.sparse CSR output straight from category
+codes: one stored value per row. The vocabulary is fitted once (optionally
+chunk by chunk), rare and unseen levels fall into an 'other' column, and
+hash_width caps the output width by hashing labels into a fixed number of
+buckets instead of keeping a vocabulary.
+
+Example:
+
+    encoder = SparseOneHotEncoder(min_frequency=10).fit(df['Zip'])
+    matrix = encoder.transform(df['Zip'])
+    print(encoder.memory_report(df['Zip']))
+'''
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from Category_Recode import encode
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, iter_source
+
+
+class SparseOneHotEncoder:
+    '''One-hot encode one column into CSR with an 'other' bucket.
+
+    min_frequency drops levels seen fewer times than this into 'other';
+    max_categories keeps only the most frequent levels; hash_width switches
+    to feature hashing with that many columns and needs no fit.
+    '''
+
+    def __init__(self, min_frequency=1, max_categories=None, hash_width=None,
+                 other_label='other', dtype=np.uint8):
+        self.min_frequency = min_frequency
+        self.max_categories = max_categories
+        self.hash_width = hash_width
+        self.other_label = other_label
+        self.dtype = dtype
+        self.vocabulary = None
+
+    def fit(self, source, column=None, chunksize=DEFAULT_CHUNKSIZE):
+        '''Fit the vocabulary from a Series, or a column of a path/chunk source.'''
+        if self.hash_width:
+            return self
+        counts = None
+        for series in self._iter_series(source, column, chunksize):
+            chunk_counts = series.value_counts(dropna=True)
+            counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        counts = counts if counts is not None else pd.Series(dtype=np.int64)
+        counts = counts[counts >= self.min_frequency].sort_values(ascending=False, kind='stable')
+        if self.max_categories is not None:
+            counts = counts.iloc[:self.max_categories]
+        self.vocabulary = pd.Index(counts.index)
+        return self
+
+    def _iter_series(self, source, column, chunksize):
+        if isinstance(source, pd.Series):
+            yield source
+            return
+        for chunk in iter_source(source, columns=[column], chunksize=chunksize):
+            yield chunk[column]
+
+    @property
+    def width(self):
+        if self.hash_width:
+            return self.hash_width
+        return len(self.vocabulary) + 1
+
+    def feature_names(self, prefix=None):
+        if self.hash_width:
+            names = [f'hash_{i}' for i in range(self.hash_width)]
+        else:
+            names = [str(label) for label in self.vocabulary] + [self.other_label]
+        return [f'{prefix}_{name}' for name in names] if prefix else names
+
+    def column_indices(self, series):
+        '''Output column per row; -1 marks a missing value (an all-zero row).'''
+        codes, categories = encode(series)
+        if self.hash_width:
+            # Hash the distinct labels only, then gather through the codes
+            hashed = pd.util.hash_array(categories.to_numpy(dtype=object))
+            table = (hashed % np.uint64(self.hash_width)).astype(np.int64)
+        else:
+            if self.vocabulary is None:
+                raise ValueError('SparseOneHotEncoder must be fitted before transform')
+            table = self.vocabulary.get_indexer(categories).astype(np.int64)
+            table[table < 0] = len(self.vocabulary)
+        return np.append(table, -1)[codes]
+
+    def transform(self, series):
+        columns = self.column_indices(series)
+        present = columns >= 0
+        indices = columns[present].astype(np.int32)
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum(present, out=indptr[1:])
+        data = np.ones(indices.size, dtype=self.dtype)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(columns), self.width))
+
+    def transform_chunks(self, source, column, chunksize=DEFAULT_CHUNKSIZE):
+        # Yield one CSR block per chunk using the fixed, pre-fitted vocabulary
+        for series in self._iter_series(source, column, chunksize):
+            yield self.transform(series)
+
+    def to_frame(self, matrix, index=None, prefix=None):
+        # pandas sparse-backed DataFrame with the encoder's column names
+        return pd.DataFrame.sparse.from_spmatrix(matrix, index=index,
+                                                 columns=self.feature_names(prefix))
+
+    def memory_report(self, series):
+        '''Bytes for the CSR output next to the dense get_dummies baseline.'''
+        matrix = self.transform(series)
+        sparse_bytes = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        levels = series.nunique(dropna=True)
+        # get_dummies stores one bool byte per row per distinct level
+        dense_bytes = len(series) * levels
+        return {
+            'rows': len(series),
+            'levels': int(levels),
+            'width': self.width,
+            'sparse_bytes': int(sparse_bytes),
+            'dense_get_dummies_bytes': int(dense_bytes),
+            'ratio': dense_bytes / sparse_bytes if sparse_bytes else float('inf'),
+        }
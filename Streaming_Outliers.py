@@ -0,0 +1,106 @@
+'''Streaming IQR and percentile outlier detection.
+
+The IQR method in Outliers.py (quantile(0.25) / quantile(0.75)) and the
+percentile method (quantile(0.01) / quantile(0.99)) sort the full column in
+memory. Here one chunked pass builds a QuantileSketch per column, fences are
+read off the sketches, and a second pass flags or filters rows chunk by chunk.
+Sketches from different partitions can be merged before the fences are taken.
+
+Example:
+
+    sketches = fit_sketches('feed.csv', ['Age'])
+    fences = iqr_fences(sketches)
+    for outliers in filter_outliers('feed.csv', fences):
+        print(outliers)
+'''
+
+import numpy as np
+
+from Quantile_Sketch import QuantileSketch
+from Streaming_Standardise import DEFAULT_CHUNKSIZE, iter_source
+
+
+class Fences:
+    '''Lower and upper bounds for one column plus the sketch rank error.'''
+
+    def __init__(self, column, lower, upper, rank_error=0.0):
+        self.column = column
+        self.lower = lower
+        self.upper = upper
+        self.rank_error = rank_error
+
+    def mask(self, values):
+        # True where a value falls outside the fences
+        values = np.asarray(values, dtype=np.float64)
+        return (values < self.lower) | (values > self.upper)
+
+    def __repr__(self):
+        return (f'Fences({self.column!r}, lower={self.lower:g}, upper={self.upper:g}, '
+                f'rank_error={self.rank_error:.4f})')
+
+
+def fit_sketches(source, columns, k=200, chunksize=DEFAULT_CHUNKSIZE, sketches=None):
+    '''One pass over source, updating a QuantileSketch per column.
+
+    Pass existing sketches to keep accumulating (e.g. partition by partition).
+    '''
+    sketches = sketches or {column: QuantileSketch(k) for column in columns}
+    for chunk in iter_source(source, columns=list(columns), chunksize=chunksize):
+        for column in columns:
+            sketches[column].update(chunk[column].to_numpy(dtype=np.float64))
+    return sketches
+
+
+def merge_sketches(*partitions):
+    # Combine {column: sketch} dicts built on separate partitions
+    merged = {}
+    for sketches in partitions:
+        for column, sketch in sketches.items():
+            if column in merged:
+                merged[column].merge(sketch)
+            else:
+                merged[column] = QuantileSketch(sketch.k).merge(sketch)
+    return merged
+
+
+def iqr_fences(sketches, whisker=1.5):
+    fences = {}
+    for column, sketch in sketches.items():
+        q1, q3 = sketch.quantile([0.25, 0.75])
+        iqr = q3 - q1
+        fences[column] = Fences(column, q1 - whisker * iqr, q3 + whisker * iqr,
+                                sketch.rank_error())
+    return fences
+
+
+def percentile_fences(sketches, lower=0.01, upper=0.99):
+    fences = {}
+    for column, sketch in sketches.items():
+        low, high = sketch.quantile([lower, upper])
+        fences[column] = Fences(column, low, high, sketch.rank_error())
+    return fences
+
+
+def outlier_mask(chunk, fences):
+    # True for rows outside the fences of any column
+    mask = np.zeros(len(chunk), dtype=bool)
+    for column, fence in fences.items():
+        mask |= fence.mask(chunk[column].to_numpy(dtype=np.float64))
+    return mask
+
+
+def flag_outliers(source, fences, flag_column='Outlier', chunksize=DEFAULT_CHUNKSIZE):
+    # Yield each chunk with a boolean flag column added
+    for chunk in iter_source(source, chunksize=chunksize):
+        chunk = chunk.copy()
+        chunk[flag_column] = outlier_mask(chunk, fences)
+        yield chunk
+
+
+def filter_outliers(source, fences, keep='outliers', chunksize=DEFAULT_CHUNKSIZE):
+    '''Yield only the outlier rows (keep='outliers') or only the inliers.'''
+    if keep not in ('outliers', 'inliers'):
+        raise ValueError(f"keep must be 'outliers' or 'inliers', not {keep!r}")
+    for chunk in iter_source(source, chunksize=chunksize):
+        mask = outlier_mask(chunk, fences)
+        yield chunk[mask if keep == 'outliers' else ~mask]
@@ -0,0 +1,180 @@
+'''Streaming standardisation for files that do not fit in memory.
+
+StandardScaler.fit_transform and the manual (df[col] - mean) / std recipe in
+Standardise_Numeric.py need the whole DataFrame in memory. Here the mean and
+variance are collected in a single chunked pass with Welford/Chan merging,
+then the file is read again chunk by chunk and the standardised output is
+written as it goes, so memory stays bounded by the chunk size.
+
+Example:
+
+    moments = fit_moments('feed.csv', ['Age', 'Salary'])
+    standardise_file('feed.csv', 'feed_std.csv', ['Age', 'Salary'])
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _is_arrow_path(path):
+    return str(path).lower().endswith(('.parquet', '.pq', '.feather', '.arrow', '.ipc'))
+
+
+def read_chunks(path, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    # Yield DataFrame chunks from a CSV, Parquet or Feather file
+    if _is_arrow_path(path):
+        from Arrow_IO import iter_frames
+
+        yield from iter_frames(path, columns=columns, batch_size=chunksize)
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def iter_source(source, columns=None, chunksize=DEFAULT_CHUNKSIZE):
+    # Accept a file path, a single DataFrame or an iterable of DataFrame chunks
+    if isinstance(source, (str, os.PathLike)):
+        yield from read_chunks(source, columns=columns, chunksize=chunksize)
+    elif isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start:start + chunksize]
+    else:
+        yield from source
+
+
+class ChunkWriter:
+    '''Append DataFrame chunks to a CSV, Parquet or Feather file.'''
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._arrow_writer = None
+        self._wrote_header = False
+
+    def write(self, chunk):
+        if _is_arrow_path(self.path):
+            if self._arrow_writer is None:
+                from Arrow_IO import ArrowChunkWriter
+
+                self._arrow_writer = ArrowChunkWriter(self.path)
+            self._arrow_writer.write(chunk)
+        else:
+            chunk.to_csv(self.path, mode='a' if self._wrote_header else 'w',
+                         header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+            self._arrow_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RunningMoments:
+    '''Per-column count, mean and sum of squared deviations (M2).
+
+    Chunks are folded in with Chan's parallel update, which is numerically
+    stable and lets moments from different chunks or workers be merged.
+    NaN values are ignored, matching StandardScaler.
+    '''
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width, dtype=np.float64)
+        self.m2 = np.zeros(width, dtype=np.float64)
+
+    def update(self, values):
+        # values: 2-D array (rows x columns) for one chunk
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        total = np.where(valid, values, 0.0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0.0)
+        deviations = np.where(valid, values - mean, 0.0)
+        m2 = (deviations * deviations).sum(axis=0)
+        self._combine(count, mean, m2)
+        return self
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError('Cannot merge moments over different columns')
+        self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, count / total, 0.0)
+            cross = np.where(total > 0, self.count * count / total, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta * delta * cross
+        self.count = total
+
+    def var(self, ddof=0):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof))
+
+    def scale(self, ddof=0):
+        # Zero or undefined spread is left unscaled, as StandardScaler does
+        std = self.std(ddof)
+        return np.where((std == 0) | np.isnan(std), 1.0, std)
+
+
+def fit_moments(source, columns, chunksize=DEFAULT_CHUNKSIZE):
+    # One pass over the source to collect running moments for the columns
+    moments = RunningMoments(columns)
+    for chunk in iter_source(source, columns=columns, chunksize=chunksize):
+        moments.update(chunk[moments.columns].to_numpy(dtype=np.float64))
+    return moments
+
+
+def standardise_chunk(chunk, moments, ddof=0, dtype=np.float64):
+    # Standardise the fitted columns of one chunk, leaving other columns as-is
+    values = chunk[moments.columns].to_numpy(dtype=dtype)
+    chunk = chunk.copy()
+    center = moments.mean.astype(dtype)
+    scale = moments.scale(ddof).astype(dtype)
+    chunk[moments.columns] = (values - center) / scale
+    return chunk
+
+
+def standardise_file(src, dst, columns, chunksize=DEFAULT_CHUNKSIZE, ddof=0, moments=None,
+                     dtype=np.float64, prefetch=0):
+    '''Standardise columns of src into dst without loading either in memory.
+
+    ddof=0 matches StandardScaler; ddof=1 matches the pandas .std() recipe.
+    Pass previously fitted moments to skip the statistics pass. dtype=np.float32
+    halves the output and working memory; moments are still accumulated in float64.
+    prefetch > 0 reads and writes that many chunks ahead in background threads
+    (Prefetch_IO).
+    '''
+    if moments is None:
+        moments = fit_moments(src, columns, chunksize=chunksize)
+    if prefetch:
+        from Prefetch_IO import transform_file
+
+        transform_file(src, dst, lambda chunk: standardise_chunk(chunk, moments, ddof, dtype),
+                       chunksize, prefetch_depth=prefetch, write_depth=prefetch)
+        return moments
+    if os.path.exists(dst):
+        os.remove(dst)
+    with ChunkWriter(dst) as writer:
+        for chunk in read_chunks(src, chunksize=chunksize):
+            writer.write(standardise_chunk(chunk, moments, ddof=ddof, dtype=dtype))
+    return moments
@@ -0,0 +1,80 @@
+'''Vectorised z-score outlier detection over many columns at once.
+
+Outliers.py calls scipy.stats.zscore(df['Age']) one column at a time, stores a
+'Z-Score' column and then filters, which costs a float64 copy per column. Here
+all columns are pulled into one 2-D block (float32 by default), the centre and
+scale are computed per column, and rows are tested in blocks against
+|x - center| > threshold * scale, so no z-score array or helper column is ever
+built. The result is a row mask or the positions of the outlier rows.
+
+method='standard' uses mean and population std (as scipy zscore does);
+method='robust' uses median and MAD scaled by 1.4826 (the modified z-score).
+
+Example:
+
+    rows = zscore_outlier_rows(df, ['Age', 'Salary'], threshold=3)
+    outliers = df.iloc[rows]
+'''
+
+import numpy as np
+
+from Streaming_Standardise import RunningMoments
+
+# MAD -> standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+DEFAULT_BLOCK_ROWS = 65_536
+
+
+def _block(frame, columns, dtype):
+    if columns is None:
+        return np.asarray(frame, dtype=dtype)
+    return frame[list(columns)].to_numpy(dtype=dtype)
+
+
+def zscore_params(values, method='standard', block_rows=DEFAULT_BLOCK_ROWS):
+    '''Per-column (center, scale) for a 2-D block; NaN values are ignored.'''
+    if method == 'standard':
+        moments = RunningMoments(range(values.shape[1]))
+        for start in range(0, values.shape[0], block_rows):
+            moments.update(values[start:start + block_rows])
+        return moments.mean, moments.std()
+    if method == 'robust':
+        center = np.nanmedian(values, axis=0)
+        mad = np.empty(values.shape[1], dtype=np.float64)
+        # Column by column so only one deviation column is held at a time
+        for j in range(values.shape[1]):
+            mad[j] = np.nanmedian(np.abs(values[:, j] - center[j]))
+        return center.astype(np.float64), mad * MAD_SCALE
+    raise ValueError(f"method must be 'standard' or 'robust', not {method!r}")
+
+
+def zscore_cell_mask(values, center, scale, threshold=3.0):
+    # 2-D boolean mask of cells whose |z| exceeds threshold (NaN never does)
+    limit = (threshold * scale).astype(values.dtype)
+    with np.errstate(invalid='ignore'):
+        return np.abs(values - center.astype(values.dtype)) > limit
+
+
+def zscore_mask(frame, columns=None, threshold=3.0, method='standard', how='any',
+                dtype=np.float32, block_rows=DEFAULT_BLOCK_ROWS, params=None):
+    '''Row mask of outliers across columns.
+
+    how='any' flags a row if any column is an outlier, how='all' only if all are.
+    Pass params=(center, scale) to reuse statistics fitted elsewhere.
+    '''
+    if how not in ('any', 'all'):
+        raise ValueError(f"how must be 'any' or 'all', not {how!r}")
+    values = _block(frame, columns, dtype)
+    center, scale = params if params is not None else zscore_params(values, method, block_rows)
+    # Zero spread means no value can be flagged, as with scipy's nan z-scores
+    scale = np.where(scale == 0, np.inf, scale)
+    mask = np.empty(values.shape[0], dtype=bool)
+    for start in range(0, values.shape[0], block_rows):
+        cells = zscore_cell_mask(values[start:start + block_rows], center, scale, threshold)
+        mask[start:start + block_rows] = cells.any(axis=1) if how == 'any' else cells.all(axis=1)
+    return mask
+
+
+def zscore_outlier_rows(frame, columns=None, threshold=3.0, method='standard', **kwargs):
+    # Positions of the outlier rows, for df.iloc[...]
+    return np.flatnonzero(zscore_mask(frame, columns, threshold, method, **kwargs))